@@ -0,0 +1,162 @@
+"""
+BATCH INGESTION
+
+Parse many monthly lichess dumps at once, one worker process per month. Each
+month is written to its own CSV partition, and a manifest.json next to the
+partitions records every month's row count and content hash. A month is only
+parsed again when its dump, the parser code or the header filter has changed
+since the manifest was written, so adding a new month costs one month's parse.
+
+    python batch_ingest.py ../data/lichess_db_chess960_rated_2024-*.pgn.zst
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pgn_parser
+
+# Copyright Josiah Plett 2024
+
+def get_month(pgn_file_path):
+    # lichess_db_chess960_rated_2024-08.pgn.zst -> 2024-08
+    name = os.path.basename(pgn_file_path)
+    match = re.search(r'(\d{4}-\d{2})', name)
+    if match:
+        return match.group(1)
+    return name.split('.')[0]
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_input_fingerprint(pgn_file_path, parser_hash, header_filter):
+    # Everything a partition depends on; if none of it changed, neither did the partition
+    stat = os.stat(pgn_file_path)
+    return {
+        'input': os.path.abspath(pgn_file_path),
+        'input_size': stat.st_size,
+        'input_mtime': stat.st_mtime,
+        'parser_sha256': parser_hash,
+        'filter': header_filter.settings(),
+    }
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest_path, manifest):
+    temporary_path = manifest_path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+
+def is_up_to_date(entry, fingerprint, output_dir):
+    if entry is None:
+        return False
+    if any(entry.get(key) != value for key, value in fingerprint.items()):
+        return False
+
+    # The partition itself must still be the one the manifest describes
+    output_path = os.path.join(output_dir, entry['output'])
+    return os.path.exists(output_path) and hash_file(output_path) == entry['output_sha256']
+
+
+def can_resume(checkpoint_path, fingerprint):
+    # Only a checkpoint saved by a run of the same dump, parser code and filter can be continued
+    if not os.path.exists(checkpoint_path):
+        return False
+    with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+        return json.load(checkpoint_file).get('fingerprint') == fingerprint
+
+
+def ingest_month(month, pgn_file_path, output_dir, header_filter, fingerprint):
+    # Worker task: parse one month into its partition, logging its progress to <month>.log.
+    # An interrupted month picks up from the parser's checkpoint the next time, unless its
+    # fingerprint has changed since, in which case the partial partition is parsed again.
+    output_path = os.path.join(output_dir, f'{month}.csv')
+    checkpoint_path = pgn_parser.get_checkpoint_path(output_path)
+    resume = can_resume(checkpoint_path, fingerprint)
+    if not resume:
+        for stale_path in [checkpoint_path, output_path]:
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    with open(os.path.join(output_dir, f'{month}.log'), 'a', encoding='utf-8') as log, \
+         contextlib.redirect_stdout(log):
+        rows, output_sha256 = pgn_parser.write_csv(pgn_file_path, output_path, header_filter, 1, resume,
+                                                   fingerprint=fingerprint)
+        header_filter.report()
+
+    return {
+        'output': os.path.basename(output_path),
+        'rows': rows,
+        'output_sha256': output_sha256,
+        'rejected': header_filter.rejected,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Parse monthly lichess dumps into one partition per month.')
+    parser.add_argument('pgn_file_paths', nargs='+', help='monthly .pgn or .pgn.zst dumps')
+    parser.add_argument('-o', '--output-dir', default='../data/output/months')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='number of months parsed at the same time (default: one per core)')
+    pgn_parser.add_filter_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    header_filter = pgn_parser.get_header_filter(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(args.output_dir, 'manifest.json')
+    manifest = load_manifest(manifest_path)
+    parser_hash = pgn_parser.get_parser_hash()
+
+    months = {}
+    for pgn_file_path in args.pgn_file_paths:
+        month = get_month(pgn_file_path)
+        if month in months:
+            raise ValueError(f'{pgn_file_path} and {months[month][0]} are both for {month}')
+
+        fingerprint = get_input_fingerprint(pgn_file_path, parser_hash, header_filter)
+        if is_up_to_date(manifest.get(month), fingerprint, args.output_dir):
+            print(f'{month}: up to date ({manifest[month]["rows"]} games), skipping.')
+            continue
+        months[month] = (pgn_file_path, fingerprint)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(ingest_month, month, pgn_file_path, args.output_dir, header_filter.without_counts(),
+                            fingerprint): month
+            for month, (pgn_file_path, fingerprint) in months.items()
+        }
+
+        for future in as_completed(futures):
+            month = futures[future]
+            entry = future.result()
+            manifest[month] = {**months[month][1], **entry}
+            save_manifest(manifest_path, manifest)
+            print(f'{month}: {entry["rows"]} games written to {entry["output"]}.')
+
+    print(f'{len(manifest)} months in {manifest_path}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+BENCHMARK
+
+Measures the hot paths of the parser and the models on fixed inputs, so every
+optimization is measured against the last one rather than assumed:
+
+    do_processing       games/s building each game's row from a parsed GameNode tree
+    read_record         games/s parsing PGN text straight to rows (the parser's own path)
+    phase_detection     plies/s of is_middlegame and is_endgame
+    classification_1    rows/s reading, cleaning and normalizing a games CSV
+    standardization     rows/s of regression_part_A_1's two streaming passes
+    ridge_cv_sweep      regression_part_A_2's 100-lambda, 10-fold sweep
+    nested_cv           classification_4's nested cross-validation, on a smaller grid
+
+The synthetic games are random legal Chess960 games with clock times, the same
+ones on every run. The CSVs are made from their rows, and the models are fitted
+on seeded random data. When the lichess sample PGN is there, the PGN benchmarks
+also run on its first games, as "[sample]".
+
+    python benchmark.py --save-baseline    # measure, and keep the results as the baseline
+    python benchmark.py                    # measure, and flag anything slower than the baseline
+
+Every run writes its results to ../data/output/benchmarks/results.json. A
+benchmark is a regression when its rate drops more than --tolerance below the
+baseline, and the run then exits with status 1.
+"""
+
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import chess.pgn
+import numpy as np
+import pandas as pd
+
+from pgn_parser import do_processing, read_record
+from phase_detection import is_endgame, is_middlegame
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'project-2-supervised-learning-classification-and-regression'))
+import classification_1  # noqa: E402
+import classification_4  # noqa: E402
+import regression_part_A_1  # noqa: E402
+import regression_part_A_2  # noqa: E402
+from classification_5 import prepare_parsed_games  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'))
+from synthetic_games import SEED, make_synthetic_pgn  # noqa: E402
+
+# Copyright Josiah Plett 2024
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(ANALYSIS_DIR, '..', 'data', 'output', 'benchmarks')
+SAMPLE_PGN = os.path.join(ANALYSIS_DIR, '..', 'data', 'lichess_db_chess960_rated_2024-08.pgn')
+
+SAMPLE_GAMES = 500
+CSV_ROWS = 100_000
+PHASE_DETECTION_PASSES = 10
+
+# regression_part_A_1's input columns, TotalPlies first
+PART_A_COLUMNS = [
+    'TotalPlies', 'EloDifference', 'Middlegame', 'WhiteOpeningTime', 'BlackOpeningTime', 'WhiteTotalTime',
+    'BlackTotalTime',
+]
+
+# setup() builds the inputs once, outside the timing; run(inputs) is timed and returns how many units it did
+Benchmark = namedtuple('Benchmark', ['name', 'unit', 'setup', 'run'])
+
+
+def read_sample_pgn(game_count=SAMPLE_GAMES):
+    # The first 3|0 games of the lichess sample, or None when it isn't there or has none (e.g. a Git LFS pointer)
+    if not os.path.exists(SAMPLE_PGN):
+        return None
+    games = []
+    with open(SAMPLE_PGN, encoding='utf-8') as pgn:
+        game = chess.pgn.read_game(pgn)
+        while game is not None and len(games) < game_count:
+            if game.headers.get('TimeControl') == '180+0':
+                games.append(str(game))
+            game = chess.pgn.read_game(pgn)
+    if not games:
+        return None
+    return '\n\n'.join(games) + '\n'
+
+
+def read_games(pgn_text):
+    pgn = io.StringIO(pgn_text)
+    games = []
+    while (game := chess.pgn.read_game(pgn)) is not None:
+        games.append(game)
+    return games
+
+
+def read_positions(pgn_text):
+    # The board after every ply of every game
+    positions = []
+    for game in read_games(pgn_text):
+        board = game.board()
+        for move in game.mainline_moves():
+            board.push(move)
+            positions.append(board.copy(stack=False))
+    return positions
+
+
+def make_games_csv(directory, pgn_text, rows=CSV_ROWS):
+    """
+    The parsed rows of the games, repeated to the given number of rows, written as the CSVs
+    classification_1 (filter_endgames' output) and regression_part_A_1 (simplification_utility's) read.
+    """
+    pgn = io.StringIO(pgn_text)
+    records = []
+    while (record := read_record(pgn)) is not None:
+        if record is not chess.pgn.SKIP:
+            records.append({key: str(value) for key, value in record.items()})
+    games = prepare_parsed_games(pd.DataFrame(records))
+    games = pd.concat([games] * (rows // len(games) + 1), ignore_index=True)[:rows]
+
+    all_games_csv = os.path.join(directory, 'all_games.csv')
+    games.to_csv(all_games_csv, index=False)
+    part_a_csv = os.path.join(directory, 'part_a_1_pre.csv')
+    games[PART_A_COLUMNS].to_csv(part_a_csv, index=False)
+    return all_games_csv, part_a_csv
+
+
+def run_do_processing(games):
+    for game in games:
+        do_processing(game)
+    return len(games)
+
+
+def run_read_record(pgn_text):
+    pgn = io.StringIO(pgn_text)
+    count = 0
+    while read_record(pgn) is not None:
+        count += 1
+    return count
+
+
+def run_phase_detection(positions):
+    # A few passes, since one takes only milliseconds
+    for _ in range(PHASE_DETECTION_PASSES):
+        for board in positions:
+            is_middlegame(board)
+            is_endgame(board)
+    return len(positions) * PHASE_DETECTION_PASSES
+
+
+def run_classification_1(all_games_csv):
+    cleaned = classification_1.clean_games(classification_1.load_games(all_games_csv))
+    column_stats = classification_1.get_column_stats(cleaned, classification_1.COLUMNS_TO_NORMALIZE)
+    return len(classification_1.process_games(cleaned, column_stats))
+
+
+def run_standardization(csv_paths):
+    part_a_csv, output_csv = csv_paths
+    scaler = regression_part_A_1.fit_standardization(part_a_csv, PART_A_COLUMNS)
+    regression_part_A_1.standardize_csv(part_a_csv, output_csv, scaler)
+    return scaler['rows']
+
+
+def make_regression_data(rows=200_000, seed=SEED):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.standard_normal((rows, 6)), columns=PART_A_COLUMNS[1:])
+    y = pd.Series(X.to_numpy() @ rng.standard_normal(6) + rng.standard_normal(rows), name='TotalPlies')
+    return X, y
+
+
+def run_ridge_cv_sweep(data):
+    X, y = data
+    regression_part_A_2.evaluate_ridge_regression(X, y, np.linspace(50, 1000, 100))
+    return 1
+
+
+def make_classification_data(rows=3_000, seed=SEED):
+    rng = np.random.default_rng(seed)
+    X = rng.random((rows, 14))
+    y = (X @ rng.standard_normal((14, 3)) + rng.standard_normal((rows, 3))).argmax(axis=1)
+    return X, y
+
+
+def run_nested_cv(data):
+    X, y = data
+    with contextlib.redirect_stdout(io.StringIO()):
+        classification_4.nested_cv(X, y, np.logspace(-8, 0, 50), np.arange(2, 13), 5, 5, workers=1)
+    return 1
+
+
+def get_benchmarks(directory):
+    synthetic = make_synthetic_pgn()
+    sample = read_sample_pgn()
+
+    @functools.lru_cache(maxsize=None)
+    def games_csvs():
+        # Written once, by whichever benchmark needs them first
+        return make_games_csv(directory, synthetic)
+
+    benchmarks = []
+    for source, pgn_text in [('synthetic', synthetic), ('sample', sample)]:
+        if pgn_text is None:
+            continue
+        benchmarks += [
+            Benchmark(f'do_processing[{source}]', 'games/s', lambda text=pgn_text: read_games(text), run_do_processing),
+            Benchmark(f'read_record[{source}]', 'games/s', lambda text=pgn_text: text, run_read_record),
+            Benchmark(f'phase_detection[{source}]', 'plies/s', lambda text=pgn_text: read_positions(text),
+                      run_phase_detection),
+        ]
+    benchmarks += [
+        Benchmark('classification_1', 'rows/s', lambda: games_csvs()[0], run_classification_1),
+        Benchmark('standardization', 'rows/s', lambda: (games_csvs()[1], os.path.join(directory, 'standardized.csv')),
+                  run_standardization),
+        Benchmark('ridge_cv_sweep', 'sweeps/s', make_regression_data, run_ridge_cv_sweep),
+        Benchmark('nested_cv', 'runs/s', make_classification_data, run_nested_cv),
+    ]
+    return benchmarks
+
+
+def measure(benchmark, repeat):
+    # The best of the repeats, so one slow run (another process, a cold cache) doesn't count as a regression
+    inputs = benchmark.setup()
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            work = benchmark.run(inputs)
+            seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    if not work:
+        raise ValueError(f'{benchmark.name} did no work, so it has no rate to compare')
+    return {'unit': benchmark.unit, 'work': work, 'seconds': best, 'rate': work / best}
+
+
+def compare(results, baseline, tolerance):
+    # Print every benchmark against the baseline, and return the names of the ones that got slower
+    regressions = []
+    print(f'{"benchmark":<28}{"rate":>16}{"baseline":>16}{"change":>10}')
+    for name, result in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            print(f'{name:<28}{result["rate"]:>16.1f}{"-":>16}{"new":>10}')
+            continue
+        if not old['rate']:
+            # Saved before measure rejected benchmarks that do no work; there is nothing to compare with
+            print(f'{name:<28}{result["rate"]:>16.1f}{old["rate"]:>16.1f}{"no rate":>10}')
+            continue
+        change = result['rate'] / old['rate'] - 1
+        flag = ''
+        if change < -tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<28}{result["rate"]:>16.1f}{old["rate"]:>16.1f}{change:>+10.1%}{flag}')
+    return regressions
+
+
+def save_json(results, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as outfile:
+        json.dump(results, outfile, indent=2)
+    os.replace(temporary_path, path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the parser and model hot paths.')
+    parser.add_argument('-k', '--only', nargs='+', metavar='NAME',
+                        help='only the benchmarks whose name starts with one of these')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best counts (default: 3)')
+    parser.add_argument('--output', default=os.path.join(BENCHMARK_DIR, 'results.json'))
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='how much slower than the baseline counts as a regression (default: 0.2, 20%%)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'benchmarks': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as directory:
+        for benchmark in get_benchmarks(directory):
+            if args.only and not any(benchmark.name.startswith(prefix) for prefix in args.only):
+                continue
+            result = measure(benchmark, args.repeat)
+            results['benchmarks'][benchmark.name] = result
+            print(f'{benchmark.name}: {result["rate"]:.1f} {result["unit"]} ({result["seconds"]:.3f}s)')
+
+    save_json(results, args.output)
+    print(f'Saved the results to {args.output}.')
+
+    if args.save_baseline:
+        save_json(results, args.baseline)
+        print(f'Saved them as the baseline, {args.baseline}.')
+        return
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare with yet; run with --save-baseline to keep one.')
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as infile:
+        baseline = json.load(infile)
+    print()
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s): {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+COLUMNAR GAMES
+
+A directory of .npy files holding the parsed games column by column, as an
+alternative to the CSV that pgn_parser.py writes. Scalar columns are typed,
+TimeControl, Termination and FEN are stored as codes into a small table of
+categories, and WhiteTimes/BlackTimes are stored as one flat int16 array of
+move times per column plus the offsets where each game's moves start.
+
+Loading the columns back is a handful of np.load calls, with no string parsing.
+classification_1.py reads such a directory in place of the parsed games CSV.
+"""
+
+import os
+from array import array
+
+import numpy as np
+
+# Copyright Josiah Plett 2024
+
+# Stands in for an Elo (or Elo difference) that was missing from the headers
+MISSING_INT = -32768
+
+INT_COLUMNS = {
+    'Result': np.int8,
+    'WhiteElo': np.int16,
+    'BlackElo': np.int16,
+    'EloDifference': np.int16,
+    'TotalMoves': np.int16,
+    'Middlegame': np.int16,
+    'Endgame': np.int16,
+}
+
+FLOAT_COLUMNS = [
+    'WhiteOpeningTime', 'BlackOpeningTime', 'WhiteMiddlegameTime', 'BlackMiddlegameTime',
+    'WhiteEndgameTime', 'BlackEndgameTime', 'WhiteTotalTime', 'BlackTotalTime'
+]
+
+CATEGORICAL_COLUMNS = ['TimeControl', 'Termination', 'FEN']
+
+STRING_COLUMNS = ['White', 'Black', 'GameId']
+
+RAGGED_COLUMNS = ['WhiteTimes', 'BlackTimes']
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return MISSING_INT
+
+
+class ColumnarWriter:
+    # Collects rows from do_processing and writes them out as columns when closed
+    def __init__(self, directory):
+        self.directory = directory
+        self.columns = {column: [] for column in list(INT_COLUMNS) + FLOAT_COLUMNS + STRING_COLUMNS}
+        self.categories = {column: {} for column in CATEGORICAL_COLUMNS}
+        self.codes = {column: array('h') for column in CATEGORICAL_COLUMNS}
+        self.values = {column: array('h') for column in RAGGED_COLUMNS}
+        self.offsets = {column: array('q', [0]) for column in RAGGED_COLUMNS}
+
+    def writerow(self, data):
+        for column in INT_COLUMNS:
+            self.columns[column].append(to_int(data[column]))
+        for column in FLOAT_COLUMNS + STRING_COLUMNS:
+            self.columns[column].append(data[column])
+
+        for column in CATEGORICAL_COLUMNS:
+            categories = self.categories[column]
+            code = categories.setdefault(data[column], len(categories))
+            self.codes[column].append(code)
+
+        for column in RAGGED_COLUMNS:
+            self.values[column].extend(data[column])
+            self.offsets[column].append(len(self.values[column]))
+
+    def close(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        for column, dtype in INT_COLUMNS.items():
+            self.save(column, np.array(self.columns[column], dtype=dtype))
+        for column in FLOAT_COLUMNS:
+            self.save(column, np.array(self.columns[column], dtype=np.float64))
+        for column in STRING_COLUMNS:
+            self.save(column, np.array(self.columns[column], dtype=str))
+
+        for column in CATEGORICAL_COLUMNS:
+            self.save(f'{column}.codes', np.frombuffer(self.codes[column], dtype=np.int16))
+            self.save(f'{column}.categories', np.array(list(self.categories[column]), dtype=str))
+
+        for column in RAGGED_COLUMNS:
+            self.save(f'{column}.values', np.frombuffer(self.values[column], dtype=np.int16))
+            self.save(f'{column}.offsets', np.frombuffer(self.offsets[column], dtype=np.int64))
+
+    def save(self, name, values):
+        np.save(os.path.join(self.directory, f'{name}.npy'), values)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+
+
+def load_games(directory, mmap_mode=None, columns=None):
+    # Load a directory written by ColumnarWriter into a dict of arrays, every column or only the given ones.
+    # A ragged column X comes back as the flat values in games['X'] and the offsets in games['XOffsets'],
+    # so game i's moves are games['X'][games['XOffsets'][i]:games['XOffsets'][i + 1]].
+    def load(name):
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+
+    def wanted(names):
+        return [name for name in names if columns is None or name in columns]
+
+    games = {}
+    for column in wanted(list(INT_COLUMNS) + FLOAT_COLUMNS + STRING_COLUMNS):
+        games[column] = load(column)
+    for column in wanted(CATEGORICAL_COLUMNS):
+        games[column] = load(f'{column}.categories')[load(f'{column}.codes')]
+    for column in wanted(RAGGED_COLUMNS):
+        games[column] = load(f'{column}.values')
+        games[f'{column}Offsets'] = load(f'{column}.offsets')
+    return games
+
+
+def split_ragged(values, offsets):
+    # One array of move times per game
+    return np.split(values, offsets[1:-1])
+
+
+def any_per_game(condition, offsets):
+    # Whether any of each game's values meets the condition, a boolean array over a ragged column's
+    # flat values, e.g. any_per_game(games['WhiteTimes'] < 0, games['WhiteTimesOffsets'])
+    counts = np.concatenate([[0], np.cumsum(condition)])
+    return counts[offsets[1:]] > counts[offsets[:-1]]
@@ -1,19 +1,36 @@
+import argparse
 import csv
 
 # Copyright Josiah Plett 2024
 
 
-def process_all_games(input_csv, output_csv):
+def process_games(input_csv, output_csv_all_games, output_csv_endgame_games):
+    # One pass over the parsed games: fix up every game's middlegame time and write it to the
+    # all-games CSV, and write the games that reached an endgame to the endgame CSV as well
+    counts = {"kept": 0, "endgame": 0, "rejected": 0}
+
     with open(input_csv, "r", encoding="utf-8") as infile, open(
-        output_csv, "w", newline="", encoding="utf-8"
-    ) as outfile:
+        output_csv_all_games, "w", newline="", encoding="utf-8"
+    ) as all_games_file, open(
+        output_csv_endgame_games, "w", newline="", encoding="utf-8"
+    ) as endgame_games_file:
 
         reader = csv.DictReader(infile)
-        fieldnames = reader.fieldnames
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
+
+        if reader.fieldnames is None:
+            print("No data to process.")
+            return counts
+
+        # pgn_parser calls the ply count TotalMoves; everything downstream calls it TotalPlies
+        fieldnames = ["TotalPlies" if name == "TotalMoves" else name for name in reader.fieldnames]
+        all_games_writer = csv.DictWriter(all_games_file, fieldnames=fieldnames)
+        endgame_games_writer = csv.DictWriter(endgame_games_file, fieldnames=fieldnames)
+        all_games_writer.writeheader()
+        endgame_games_writer.writeheader()
 
         for row in reader:
+            if "TotalMoves" in row:
+                row["TotalPlies"] = row.pop("TotalMoves")
             try:
                 row["Endgame"] = int(row["Endgame"])
                 row["WhiteTotalTime"] = float(row["WhiteTotalTime"])
@@ -21,6 +38,7 @@ def process_all_games(input_csv, output_csv):
                 row["WhiteOpeningTime"] = float(row["WhiteOpeningTime"])
                 row["BlackOpeningTime"] = float(row["BlackOpeningTime"])
             except ValueError:
+                counts["rejected"] += 1
                 continue
 
             if row["Endgame"] == -1:
@@ -31,45 +49,38 @@ def process_all_games(input_csv, output_csv):
                     row["BlackTotalTime"] - row["BlackOpeningTime"], 4
                 )
 
-            writer.writerow(row)
+            all_games_writer.writerow(row)
+            counts["kept"] += 1
 
+            if row["Endgame"] != -1:
+                endgame_games_writer.writerow(row)
+                counts["endgame"] += 1
 
-def filter_endgame_games(input_csv, output_csv):
-    with open(input_csv, "r", encoding="utf-8") as infile, open(
-        output_csv, "w", newline="", encoding="utf-8"
-    ) as outfile:
-
-        reader = csv.DictReader(infile)
-        fieldnames = reader.fieldnames
-
-        if fieldnames is None:
-            print("No data to process.")
-            return
+    return counts
 
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
 
-        for row in reader:
-            try:
-                if int(row["Endgame"]) != -1:
-                    writer.writerow(row)
-            except ValueError:
-                continue
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Fix up the parsed games and write them all, and the ones that reached an endgame, to CSVs."
+    )
+    parser.add_argument("input_csv", nargs="?", default="../data/output/project_2_parsed_output.csv",
+                        help="pgn_parser.py's output (default: %(default)s)")
+    parser.add_argument("output_csv_all_games", nargs="?", default="../data/output/project_2_all_games.csv",
+                        help="where every game goes (default: %(default)s)")
+    parser.add_argument("output_csv_endgame_games", nargs="?", default="../data/output/project_2_endgame_games.csv",
+                        help="where the games that reached an endgame go (default: %(default)s)")
+    return parser.parse_args()
 
 
 def main():
-    input(
-        "This file will attempt to process the data in `output/project_2_parsed_output.csv`. Press Enter to continue..."
-    )
-
-    input_csv = "../data/output/project_2_parsed_output.csv"
-    output_csv_all_games = "../data/output/project_2_all_games.csv"
-    process_all_games(input_csv, output_csv_all_games)
+    args = parse_args()
 
-    input("Processing complete. Press Enter to continue...")
+    print(f"Processing the data in `{args.input_csv}`...")
+    counts = process_games(args.input_csv, args.output_csv_all_games, args.output_csv_endgame_games)
 
-    output_csv_endgame_games = "../data/output/project_2_endgame_games.csv"
-    filter_endgame_games(output_csv_all_games, output_csv_endgame_games)
+    print(f"Kept {counts['kept']} games, written to `{args.output_csv_all_games}`.")
+    print(f"Of those, {counts['endgame']} reached an endgame, written to `{args.output_csv_endgame_games}`.")
+    print(f"Rejected {counts['rejected']} games with invalid values.")
 
 
 if __name__ == "__main__":
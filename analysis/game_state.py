@@ -0,0 +1,140 @@
+"""
+GAME STATE
+
+A game followed one move at a time, for predicting games that are still being
+played. Each push is one (move, clock) event: the move is played on the board,
+the phase checks from phase_detection.py run on the new position, and the time
+taken is added to the mover's current phase. That is the same GameClock
+do_processing uses, so nothing is recomputed from the start of the game, and
+after any ply record() is the CSV row do_processing would give the game if it
+had ended there.
+
+    state = GameState({'TimeControl': '180+0', 'Variant': 'Chess960', 'FEN': fen})
+    state.push('e4', '0:02:58')
+    state.push('e5', 179)
+    state.middlegame, state.endgame, state.get_time_fractions()
+
+Run this file on a PGN to check that, for every game, the state after its last
+move gives the same record as pgn_parser.do_processing.
+"""
+
+import sys
+
+import chess
+import chess.pgn
+
+from pgn_parser import CLOCK_REGEX, GameClock, build_record, do_processing, parse_clock_time, read_header_fields
+
+# Copyright Josiah Plett 2024
+
+
+class GameState:
+    def __init__(self, headers):
+        # headers are the game's PGN headers; any game with a clock can be followed, like the parser
+        headers = chess.pgn.Headers(headers)
+        self.header_fields = read_header_fields(headers)
+        if self.header_fields is None:
+            raise ValueError(f'not a timed game: TimeControl {headers.get("TimeControl", "")!r}')
+
+        # Headers.board() sets up the FEN and Chess960 castling the same way read_game does
+        self.board = headers.board()
+        self.clock = GameClock(self.header_fields['BaseTime'], self.header_fields['Increment'])
+
+    def push(self, move, clock_time):
+        """
+        Play one ply: a chess.Move or a SAN string, and the mover's clock after it, in seconds or as
+        a %clk string like '0:02:59'.
+        """
+        if isinstance(move, str):
+            move = self.board.parse_san(move)
+        if isinstance(clock_time, str):
+            clock_time = parse_clock_time(clock_time)
+
+        # The player to move before the move is pushed is the one who made it
+        player = 'white' if self.board.turn == chess.WHITE else 'black'
+        self.board.push(move)
+        self.clock.add_timed_ply(self.board, player, clock_time)
+
+    @property
+    def plies(self):
+        return self.clock.total_move_counter
+
+    @property
+    def middlegame(self):
+        # The ply the middlegame started on, or -1 while the game is still in the opening
+        return self.clock.middlegame_move
+
+    @property
+    def endgame(self):
+        # The ply the endgame started on, or -1 if it hasn't yet
+        return self.clock.endgame_move
+
+    @property
+    def phase(self):
+        if self.endgame != -1:
+            return 'endgame'
+        return 'middlegame' if self.middlegame != -1 else 'opening'
+
+    def get_time_fractions(self):
+        # The fraction of the base time each player has spent in each phase so far
+        base_time = self.clock.base_time
+        return {
+            f'{player.capitalize()}{phase.capitalize()}Time': self.clock.time_used[f'{player}_{phase}'] / base_time
+            for player in ['white', 'black']
+            for phase in ['opening', 'middlegame', 'endgame']
+        }
+
+    def record(self):
+        # The game so far as a row of pgn_parser.py's output, or None before its 9th ply. Its move
+        # times are copies, so the row stays as it was when the game goes on.
+        record = build_record(self.header_fields, self.clock)
+        if record is not None:
+            record['WhiteTimes'] = list(record['WhiteTimes'])
+            record['BlackTimes'] = list(record['BlackTimes'])
+        return record
+
+
+def replay(game):
+    # Follow a parsed game through a GameState, one mainline ply at a time; None if a ply has no clock time
+    state = GameState(game.headers)
+    for node in game.mainline():
+        clock_match = CLOCK_REGEX.search(node.comment)
+        if clock_match is None:
+            return
+        state.push(node.move, clock_match.group(1))
+    return state
+
+
+def compare_with_parser(pgn_file_path):
+    # Differential check of the state after each game's last move against do_processing, on every timed game
+    game_count = 0
+    mismatches = 0
+
+    with open(pgn_file_path, encoding='utf-8') as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            if read_header_fields(game.headers) is None:
+                continue
+            game_count += 1
+
+            expected = do_processing(game)
+            state = replay(game)
+            actual = state.record() if state is not None else None
+            if actual != expected:
+                mismatches += 1
+                print(f'Game {game_count} ({game.headers.get("Site", "?")}): the game state differs from do_processing')
+
+    print(f'Compared {game_count} games, {mismatches} mismatches.')
+    return mismatches
+
+
+def main():
+    pgn_file_path = sys.argv[1] if len(sys.argv) > 1 else '../data/lichess_db_chess960_rated_2024-08.pgn'
+    if compare_with_parser(pgn_file_path):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
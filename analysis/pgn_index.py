@@ -0,0 +1,194 @@
+"""
+PGN INDEX
+
+A sidecar index of a .pgn dump: the byte offset and length of every game, plus
+the headers we filter on most (Elos, TimeControl, Termination and FEN), stored
+as one numpy structured array. With it, any subset of games can be read by
+seeking straight to them instead of scanning the file with read_game.
+
+    python pgn_index.py build ../data/lichess_db_chess960_rated_2024-08.pgn
+    python pgn_index.py show ../data/lichess_db_chess960_rated_2024-08.pgn 12345
+
+    index = GameIndex('../data/lichess_db_chess960_rated_2024-08.pgn')
+    strong = np.flatnonzero(index.games['WhiteElo'] > 2200)
+    for game in index.read_games(strong):
+        ...
+
+The index needs a plain .pgn, since a .pgn.zst can not be seeked into.
+"""
+
+import argparse
+import io
+import os
+import re
+
+import chess.pgn
+import numpy as np
+
+import pgn_parser
+
+# Copyright Josiah Plett 2024
+
+# Stands in for a missing or unparseable Elo or TimeControl
+MISSING = -1
+
+INDEX_DTYPE = np.dtype([
+    ('Offset', np.int64),
+    ('Length', np.int32),
+    ('WhiteElo', np.int16),
+    ('BlackElo', np.int16),
+    ('BaseTime', np.int16),
+    ('Increment', np.int16),
+    ('Termination', np.int16),  # Code into GameIndex.terminations
+    ('FEN', np.int16),  # Code into GameIndex.fens
+])
+
+TAG_REGEX = re.compile(rb'^\[(\w+)\s+"(.*)"\]')
+
+INDEXED_TAGS = {b'WhiteElo', b'BlackElo', b'TimeControl', b'Termination', b'FEN'}
+
+
+def get_index_path(pgn_file_path):
+    return pgn_file_path + '.idx.npz'
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return MISSING
+
+
+def build_index(pgn_file_path, index_path=None):
+    # One pass over the file, reading header lines only
+    index_path = index_path or get_index_path(pgn_file_path)
+    entries = []
+    terminations = {}
+    fens = {}
+
+    def add_entry(offset, length, headers):
+        base_time, increment = pgn_parser.parse_time_control(headers.get('TimeControl', ''))
+        termination = terminations.setdefault(headers.get('Termination', ''), len(terminations))
+        fen = fens.setdefault(headers.get('FEN', ''), len(fens))
+        entries.append((
+            offset, length,
+            to_int(headers.get('WhiteElo', '')), to_int(headers.get('BlackElo', '')),
+            MISSING if base_time is None else base_time, MISSING if increment is None else increment,
+            termination, fen,
+        ))
+        if len(entries) % 100000 == 0:
+            print(f'Indexed {len(entries)} games.')
+
+    with open(pgn_file_path, 'rb') as pgn:
+        position = 0
+        game_start = None
+        headers = {}
+
+        for line in pgn:
+            if line.startswith(b'[Event '):
+                if game_start is not None:
+                    add_entry(game_start, position - game_start, headers)
+                game_start = position
+                headers = {}
+            elif line.startswith(b'['):
+                tag_match = TAG_REGEX.match(line)
+                if tag_match and tag_match.group(1) in INDEXED_TAGS:
+                    headers[tag_match.group(1).decode()] = tag_match.group(2).decode('utf-8')
+
+            position += len(line)
+
+        if game_start is not None:
+            add_entry(game_start, position - game_start, headers)
+
+    games = np.array(entries, dtype=INDEX_DTYPE)
+    np.savez(
+        index_path,
+        games=games,
+        terminations=np.array(list(terminations), dtype=str),
+        fens=np.array(list(fens), dtype=str),
+        pgn_size=np.int64(position),
+    )
+    print(f'Indexed {len(games)} games in total, saved to {index_path}.')
+    return index_path
+
+
+class GameIndex:
+    # Random access into a .pgn through its index
+    def __init__(self, pgn_file_path, index_path=None):
+        self.pgn_file_path = pgn_file_path
+        index_path = index_path or get_index_path(pgn_file_path)
+
+        with np.load(index_path) as index:
+            self.games = index['games']
+            self.terminations = index['terminations']
+            self.fens = index['fens']
+            pgn_size = int(index['pgn_size'])
+
+        if os.path.getsize(pgn_file_path) != pgn_size:
+            raise ValueError(f'{index_path} was built for a different version of {pgn_file_path}, rebuild it.')
+
+    def __len__(self):
+        return len(self.games)
+
+    def termination(self, rows=slice(None)):
+        return self.terminations[self.games['Termination'][rows]]
+
+    def fen(self, rows=slice(None)):
+        return self.fens[self.games['FEN'][rows]]
+
+    def read_text(self, rows):
+        # The PGN text of the given games, in the order given
+        with open(self.pgn_file_path, 'rb') as pgn:
+            for row in np.atleast_1d(rows):
+                offset, length = self.games['Offset'][row], self.games['Length'][row]
+                pgn.seek(offset)
+                yield pgn.read(length).decode('utf-8')
+
+    def read_games(self, rows):
+        # The given games parsed with read_game
+        for text in self.read_text(rows):
+            yield chess.pgn.read_game(io.StringIO(text))
+
+    def read_records(self, rows, header_filter=None):
+        # The given games processed into CSV rows, or SKIP for the ones pgn_parser drops
+        for text in self.read_text(rows):
+            yield pgn_parser.read_record(io.StringIO(text), header_filter)
+
+    def shard_ranges(self, shard_size=pgn_parser.SHARD_SIZE):
+        # Byte ranges of about shard_size bytes on game boundaries, without touching the PGN
+        offsets = self.games['Offset']
+        if len(offsets) == 0:
+            return []
+        ends = offsets + self.games['Length']
+        cuts = np.searchsorted(offsets, np.arange(offsets[0], ends[-1], shard_size))
+        starts = np.unique(offsets[cuts[cuts < len(offsets)]])
+        return list(zip(starts.tolist(), np.append(starts[1:], ends[-1]).tolist()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build or query the byte-offset index of a .pgn dump.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='index every game in the file')
+    build.add_argument('pgn_file_path')
+
+    show = commands.add_parser('show', help='print games by their number in the file (from 0)')
+    show.add_argument('pgn_file_path')
+    show.add_argument('rows', type=int, nargs='+')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.command == 'build':
+        build_index(args.pgn_file_path)
+    elif args.command == 'show':
+        index = GameIndex(args.pgn_file_path)
+        for text in index.read_text(args.rows):
+            print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,47 @@
 import chess.pgn
+import argparse
+import collections
+import copy
 import csv
+import functools
+import hashlib
+import io
+import json
+import os
+import queue
 import re
 import ast
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+from columnar_games import ColumnarWriter
+from phase_detection import is_middlegame, is_endgame
 
 # Copyright Josiah Plett 2024
 
+FIELDNAMES = [
+    'Result', 'White', 'Black', 'WhiteElo', 'BlackElo', 'EloDifference', 'TimeControl',
+    'Termination', 'FEN', 'WhiteTimes', 'BlackTimes', 'TotalMoves', 'Middlegame', 'Endgame',
+    'WhiteOpeningTime', 'BlackOpeningTime', 'WhiteMiddlegameTime', 'BlackMiddlegameTime',
+    'WhiteEndgameTime', 'BlackEndgameTime', 'WhiteTotalTime', 'BlackTotalTime', 'GameId'
+]
+
+# Byte size of the pieces the PGN is split into for parallel parsing
+SHARD_SIZE = 16 * 1024 * 1024
+
+# Size of the decompressed chunks handed from the decompression thread to the parser,
+# and how many of them may wait in between (this bounds the memory used)
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+DECOMPRESS_QUEUE_SIZE = 16
+
+# Seconds between checkpoints of a CSV run
+CHECKPOINT_INTERVAL = 60
+
+# The code a parsed row depends on; a run is only resumed with the same code that started it
+PARSER_SOURCES = ['pgn_parser.py', 'phase_detection.py']
+
 def parse_time_control(time_control):
     # Parse TimeControl string like '180+2'
     try:
@@ -33,153 +70,195 @@ def parse_clock_time(clock_str):
     except ValueError:
         return None
 
-def count_major_minor_pieces(board):
-    # Counts the total number of major and minor pieces on the board
-    major_minor_pieces = 0
-    for piece in board.piece_map().values():
-        if piece.piece_type in [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]:
-            major_minor_pieces += 1
-    return major_minor_pieces
-
-def is_middlegame(board):
-    # Checks if any of the middlegame conditions are met
-    # Returns a tuple (True/False, Reason)
-
-    # Condition 1: 10 or fewer major or minor pieces
-    major_minor_pieces = count_major_minor_pieces(board)
-    if major_minor_pieces <= 10:
-        return True
-
-    # Condition 2: Back rank is sparse (rows 1 and 8 have fewer than 9 pieces total)
-    back_rank_pieces = 0
-    for square in chess.SquareSet(chess.BB_RANK_1 | chess.BB_RANK_8):
-        if board.piece_at(square) is not None:
-            back_rank_pieces += 1
-    if back_rank_pieces < 9:  # fewer than 9 pieces
+class HeaderFilter:
+    # Decides from the headers alone whether a game is worth parsing, and counts what it rejects
+    def __init__(self, time_controls=('180+0',), min_elo=None, max_elo=None, terminations=None):
+        self.time_controls = set(time_controls) if time_controls else None
+        self.min_elo = min_elo
+        self.max_elo = max_elo
+        self.terminations = set(terminations) if terminations else None
+        self.rejected = {'TimeControl': 0, 'Rating': 0, 'Termination': 0}
+
+    def rejects(self, headers):
+        # Returns the name of the filter that rejected the game, or None if it passed them all
+        reason = None
+        if self.time_controls is not None and headers.get('TimeControl', '') not in self.time_controls:
+            reason = 'TimeControl'
+        elif (self.min_elo is not None or self.max_elo is not None) and not self.rating_in_bounds(headers):
+            reason = 'Rating'
+        elif self.terminations is not None and headers.get('Termination', '') not in self.terminations:
+            reason = 'Termination'
+
+        if reason is not None:
+            self.rejected[reason] += 1
+        return reason
+
+    def rating_in_bounds(self, headers):
+        # Both players have to be rated within the bounds
+        for elo_header in ('WhiteElo', 'BlackElo'):
+            try:
+                elo = int(headers.get(elo_header, ''))
+            except ValueError:
+                return False
+            if self.min_elo is not None and elo < self.min_elo:
+                return False
+            if self.max_elo is not None and elo > self.max_elo:
+                return False
         return True
 
-    # Condition 3: Sufficient mixing (at least 12 pieces or pawns in the middle 4 rows)
-    middle_rows_pieces = 0
-    for square in chess.SquareSet(chess.BB_RANK_3 | chess.BB_RANK_4 | chess.BB_RANK_5 | chess.BB_RANK_6):
-        if board.piece_at(square) is not None:
-            middle_rows_pieces += 1
-    if middle_rows_pieces >= 12:
+    def settings(self):
+        # What the filter keeps, in a form that can be saved as JSON and compared
+        return {
+            'time_controls': sorted(self.time_controls) if self.time_controls is not None else None,
+            'min_elo': self.min_elo,
+            'max_elo': self.max_elo,
+            'terminations': sorted(self.terminations) if self.terminations is not None else None,
+        }
+
+    def without_counts(self):
+        # A copy with the same settings and no rejections yet, to count one shard's rejections on
+        header_filter = copy.copy(self)
+        header_filter.rejected = dict.fromkeys(self.rejected, 0)
+        return header_filter
+
+    def add_rejected(self, rejected):
+        # Merge in the counts of a copy of this filter that ran in another process
+        for reason, count in rejected.items():
+            self.rejected[reason] += count
+
+    def report(self):
+        for reason, count in self.rejected.items():
+            print(f'Rejected {count} games by {reason}.')
+
+CLOCK_REGEX = re.compile(r'\[%clk\s+([^\]]+)\]')
+
+class GameClock:
+    # Follows one game ply by ply: the time each player took per move, and the time spent in each phase
+    def __init__(self, base_time, increment=0):
+        self.base_time = base_time
+        self.increment = increment
+
+        # Initialize move times
+        self.white_times = []
+        self.black_times = []
+        self.prev_clock = {'white': base_time, 'black': base_time}
+        self.move_number = {'white': 0, 'black': 0}
+
+        # Initialize move counters for middlegame and endgame detection
+        self.middlegame_move = -1
+        self.endgame_move = -1
+        self.total_move_counter = 0  # Counts half-moves (plies)
+
+        # Initialize time usage columns
+        self.white_opening_time = self.black_opening_time = -1
+        self.white_middlegame_time = self.black_middlegame_time = -1
+
+        # Track time used in each phase
+        self.time_used = {'white_opening': 0, 'black_opening': 0, 'white_middlegame': 0, 'black_middlegame': 0, 'white_endgame': 0, 'black_endgame': 0}
+
+    def add_ply(self, board, player, comment):
+        # Account for one ply, given the board after it was played and the comment that followed it.
+        # Returns False if the ply has no clock time, in which case the whole game is skipped.
+        clock_match = CLOCK_REGEX.search(comment)
+        if clock_match is None:
+            return False
+
+        self.add_timed_ply(board, player, parse_clock_time(clock_match.group(1)))
         return True
 
-    return False
+    def add_timed_ply(self, board, player, clock_time):
+        # Account for one ply, given the board after it was played and the player's clock in seconds
+        # after it (None if the clock couldn't be read)
+        self.total_move_counter += 1  # Increment move counter
+        self.move_number[player] += 1
+
+        if clock_time is not None:
+            # The clock after a move already has the increment added back, except after the player's
+            # first move, which lichess doesn't time
+            increment = self.increment if self.move_number[player] > 1 else 0
+            time_taken = self.prev_clock[player] - clock_time + increment
+            self.prev_clock[player] = clock_time
+
+            # Accumulate time based on the game phase
+            if player == 'white':
+                self.white_times.append(time_taken)
+            else:
+                self.black_times.append(time_taken)
+
+            if self.middlegame_move == -1:
+                self.time_used[f'{player}_opening'] += time_taken
+            elif self.endgame_move == -1:
+                self.time_used[f'{player}_middlegame'] += time_taken
+            else:
+                self.time_used[f'{player}_endgame'] += time_taken
 
-def is_endgame(board):
-    # Checks if the endgame condition is met
-    # Condition: 6 or fewer major or minor pieces
-    if count_major_minor_pieces(board) <= 6:
-        return True
-    return False
+        # Check for middlegame start
+        if self.middlegame_move == -1 and is_middlegame(board):
+            self.start_middlegame()
 
-def do_processing(game):
-    # Extract headers
-    headers = game.headers
-    result = headers.get('Result', '')
-    white = headers.get('White', '')
-    black = headers.get('Black', '')
-    white_elo = headers.get('WhiteElo', '')
-    black_elo = headers.get('BlackElo', '')
+        # Check for endgame start
+        if self.endgame_move == -1 and is_endgame(board):
+            self.endgame_move = self.total_move_counter
+            self.white_middlegame_time = self.time_used['white_middlegame'] / self.base_time
+            self.black_middlegame_time = self.time_used['black_middlegame'] / self.base_time
+
+    def start_middlegame(self):
+        self.middlegame_move, self.white_opening_time, self.black_opening_time = self.get_opening()
+
+    def get_opening(self):
+        # The middlegame ply and each player's opening time. Until the middlegame is reached the game
+        # is all opening, so it would start at the current ply.
+        if self.middlegame_move != -1:
+            return self.middlegame_move, self.white_opening_time, self.black_opening_time
+        return (
+            self.total_move_counter,
+            self.time_used['white_opening'] / self.base_time,
+            self.time_used['black_opening'] / self.base_time,
+        )
+
+def read_header_fields(headers):
+    # The header values that go into the CSV, or None if the game has no clock to follow (a TimeControl
+    # like '-'). Which time controls are kept is up to the HeaderFilter.
     time_control = headers.get('TimeControl', '')
-    termination = headers.get('Termination', '')
-    fen = headers.get('FEN', '')
 
     # Parse TimeControl
     base_time, increment = parse_time_control(time_control)
+    if base_time is None or increment is None or base_time <= 0:
+        return
 
     # Parse Result
+    result = headers.get('Result', '')
     result = 0 if result == '1/2-1/2' else 1 if result == '1-0' else -1
 
-    # Filter out all non 3|2 games, based on TimeControl
-    if base_time is None or increment is None:
-        return
-    if base_time != 180 or increment != 0:
-        return
-
-    # Initialize move times
-    white_times = []
-    black_times = []
-    prev_clock = {'white': base_time, 'black': base_time}
-    move_number = {'white': 0, 'black': 0}
-
-    # Initialize board and move counters for middlegame and endgame detection
-    board = game.board()
-    middlegame_move = -1
-    endgame_move = -1
-    total_move_counter = 0  # Counts half-moves (plies)
-
-    # Initialize time usage columns
-    white_opening_time = black_opening_time = white_middlegame_time = black_middlegame_time = -1
-    white_endgame_time = black_endgame_time = white_total_time = black_total_time = -1
-
-    # Track time used in each phase
-    time_used = {'white_opening': 0, 'black_opening': 0, 'white_middlegame': 0, 'black_middlegame': 0, 'white_endgame': 0, 'black_endgame': 0}
-
-    node = game
-
-    while node.variations:
-        next_node = node.variations[0]
-        move = next_node.move
-
-        # Update the board with the move
-        board.push(move)
-        total_move_counter += 1  # Increment move counter
-
-        comment = next_node.comment
-        clock_times = re.findall(r'\[%clk\s+([^\]]+)\]', comment)
-
-        if clock_times:
-            clock_time_str = clock_times[0]
-            clock_time = parse_clock_time(clock_time_str)
-
-            player = 'white' if node.board().turn == chess.WHITE else 'black'
-            move_number[player] += 1
-
-            if clock_time is not None:
-                time_taken = prev_clock[player] - clock_time
-                prev_clock[player] = clock_time
-
-                # Accumulate time based on the game phase
-                if player == 'white':
-                    white_times.append(time_taken)
-                else:
-                    black_times.append(time_taken)
-                
-                if middlegame_move == -1:
-                    time_used[f'{player}_opening'] += time_taken
-                elif endgame_move == -1:
-                    time_used[f'{player}_middlegame'] += time_taken
-                else:
-                    time_used[f'{player}_endgame'] += time_taken
-        else:
-            # No clock time found, skip this whole game
-            return
+    return {
+        'GameId': headers.get('Site', '').rsplit('/', 1)[-1],  # https://lichess.org/<GameId>
+        'Result': result,
+        'White': headers.get('White', ''),
+        'Black': headers.get('Black', ''),
+        'WhiteElo': headers.get('WhiteElo', ''),
+        'BlackElo': headers.get('BlackElo', ''),
+        'TimeControl': time_control,
+        'Termination': headers.get('Termination', ''),
+        'FEN': headers.get('FEN', ''),
+        'BaseTime': base_time,
+        'Increment': increment,
+    }
 
-        # Check for middlegame start
-        if middlegame_move == -1 and is_middlegame(board):
-            middlegame_move = total_move_counter
-            white_opening_time = time_used['white_opening'] / base_time
-            black_opening_time = time_used['black_opening'] / base_time
+def build_record(header_fields, clock):
+    # Turn the headers and the game's clock into the CSV row, or None if the game is too short.
+    # The clock is only read, so a game in progress can be turned into a row after every ply.
+    base_time = header_fields['BaseTime']
+    result = header_fields['Result']
+    termination = header_fields['Termination']
+    time_used = clock.time_used
+    prev_clock = clock.prev_clock
+    endgame_move = clock.endgame_move
 
-        # Check for endgame start
-        if endgame_move == -1 and is_endgame(board):
-            endgame_move = total_move_counter
-            white_middlegame_time = time_used['white_middlegame'] / base_time
-            black_middlegame_time = time_used['black_middlegame'] / base_time
-
-        node = next_node
-    
     # If the middlegame was never reached, set it to the ply where the game ended
-    if middlegame_move == -1:
-        middlegame_move = total_move_counter
-        white_opening_time = time_used['white_opening'] / base_time
-        black_opening_time = time_used['black_opening'] / base_time
+    middlegame_move, white_opening_time, black_opening_time = clock.get_opening()
 
     # Calculate total moves
-    total_moves = len(white_times) + len(black_times)
+    total_moves = len(clock.white_times) + len(clock.black_times)
 
     if total_moves <= 8:
         return  # Filter out games with fewer than 9 moves
@@ -187,12 +266,16 @@ def do_processing(game):
     # Finalize endgame time and total clock time usage
     white_endgame_time = time_used['white_endgame'] / base_time if endgame_move > -1 else -1
     black_endgame_time = time_used['black_endgame'] / base_time if endgame_move > -1 else -1
-    white_total_time = (base_time - prev_clock['white']) / base_time if termination != "Time forfeit" or result != -1 else 1
-    black_total_time = (base_time - prev_clock['black']) / base_time if termination != "Time forfeit" or result != 1 else 1
+    # With an increment, every move after the first gave the player its increment on top of the base time
+    increment = header_fields['Increment']
+    white_used = base_time - prev_clock['white'] + increment * max(len(clock.white_times) - 1, 0)
+    black_used = base_time - prev_clock['black'] + increment * max(len(clock.black_times) - 1, 0)
+    white_total_time = white_used / base_time if termination != "Time forfeit" or result != -1 else 1
+    black_total_time = black_used / base_time if termination != "Time forfeit" or result != 1 else 1
 
     # Calculate elo difference
     try:
-        elo_difference = int(white_elo) - int(black_elo)
+        elo_difference = int(header_fields['WhiteElo']) - int(header_fields['BlackElo'])
     except ValueError:
         elo_difference = ''
 
@@ -200,24 +283,25 @@ def do_processing(game):
 
     # Data for writing to CSV
     data = {
-        'White': white,
-        'Black': black,
+        'GameId': header_fields['GameId'],
+        'White': header_fields['White'],
+        'Black': header_fields['Black'],
         'Result': result,
-        'WhiteElo': white_elo,
-        'BlackElo': black_elo,
+        'WhiteElo': header_fields['WhiteElo'],
+        'BlackElo': header_fields['BlackElo'],
         'EloDifference': elo_difference,
-        'TimeControl': time_control,
+        'TimeControl': header_fields['TimeControl'],
         'Termination': termination,
-        'FEN': fen,
-        'WhiteTimes': white_times,
-        'BlackTimes': black_times,
+        'FEN': header_fields['FEN'],
+        'WhiteTimes': clock.white_times,
+        'BlackTimes': clock.black_times,
         'TotalMoves': total_moves,
         'Middlegame': middlegame_move,
         'Endgame': endgame_move,
         'WhiteOpeningTime': round(white_opening_time, significant_digits),
         'BlackOpeningTime': round(black_opening_time, significant_digits),
-        'WhiteMiddlegameTime': round(white_middlegame_time, significant_digits) if endgame_move > -1 else -1,
-        'BlackMiddlegameTime': round(black_middlegame_time, significant_digits) if endgame_move > -1 else -1,
+        'WhiteMiddlegameTime': round(clock.white_middlegame_time, significant_digits) if endgame_move > -1 else -1,
+        'BlackMiddlegameTime': round(clock.black_middlegame_time, significant_digits) if endgame_move > -1 else -1,
         'WhiteEndgameTime': round(white_endgame_time, significant_digits) if endgame_move > -1 else -1,
         'BlackEndgameTime': round(black_endgame_time, significant_digits) if endgame_move > -1 else -1,
         'WhiteTotalTime': round(white_total_time, significant_digits),
@@ -226,44 +310,513 @@ def do_processing(game):
 
     return data
 
-def main():
-    pgn_file_path = '../data/lichess_db_chess960_rated_2024-08.pgn'
-    output_csv_path = '../data/output/project_2_parsed_output.csv'
+def do_processing(game):
+    # Process a game that read_game has already built into a GameNode tree
+    header_fields = read_header_fields(game.headers)
+    if header_fields is None:
+        return
 
-    # pgn_file_path = '../data/much_shorter_mock_data.pgn'
-    # output_csv_path = '../data/output/short_parsed_output_13_extended.csv'
+    clock = GameClock(header_fields['BaseTime'], header_fields['Increment'])
+    board = game.board()
+    node = game
 
-    pgn = open(pgn_file_path)
+    while node.variations:
+        next_node = node.variations[0]
 
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = [
-            'Result', 'White', 'Black', 'WhiteElo', 'BlackElo', 'EloDifference', 'TimeControl',
-            'Termination', 'FEN', 'WhiteTimes', 'BlackTimes', 'TotalMoves', 'Middlegame', 'Endgame',
-            'WhiteOpeningTime', 'BlackOpeningTime', 'WhiteMiddlegameTime', 'BlackMiddlegameTime',
-            'WhiteEndgameTime', 'BlackEndgameTime', 'WhiteTotalTime', 'BlackTotalTime'
-        ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+        # The player to move before the move is pushed is the one who made it
+        player = 'white' if board.turn == chess.WHITE else 'black'
+        board.push(next_node.move)
 
-        game_count = 0
+        if not clock.add_ply(board, player, next_node.comment):
+            return  # No clock time found, skip this whole game
 
-        while True:
-            game = chess.pgn.read_game(pgn)
-            if game is None:
-                break  # End of file
+        node = next_node
 
-            data = do_processing(game)
+    return build_record(header_fields, clock)
+
+class GameRecordVisitor(chess.pgn.BaseVisitor):
+    # Produces the same record as do_processing straight from the movetext, without building a GameNode tree.
+    # Moves are pushed on the parser's own board, and each ply is accounted once its comments have been read.
+    def __init__(self, header_filter=None):
+        self.header_filter = header_filter
+
+    def begin_game(self):
+        self.headers = chess.pgn.Headers()
+        self.header_fields = None
+        self.clock = None
+        self.board = None
+        self.player = None  # Who made the ply that is still waiting for its comments
+        self.comments = []
+        self.is_skipped = False
+
+    def begin_headers(self):
+        return self.headers
+
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+
+    def end_headers(self):
+        if self.header_filter is not None and self.header_filter.rejects(self.headers) is not None:
+            self.is_skipped = True
+            return chess.pgn.SKIP
+
+        self.header_fields = read_header_fields(self.headers)
+        if self.header_fields is None:
+            # A time control the filter let through but that has no clock, still a TimeControl rejection
+            if self.header_filter is not None:
+                self.header_filter.rejected['TimeControl'] += 1
+            self.is_skipped = True
+            return chess.pgn.SKIP
+
+        self.clock = GameClock(self.header_fields['BaseTime'], self.header_fields['Increment'])
+
+    def visit_board(self, board):
+        self.board = board
+
+    def begin_parse_san(self, board, san):
+        # Once a ply has no clock time the game is dropped, so the rest of its moves are not worth parsing
+        if self.is_skipped:
+            return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        # board is the position after the previous ply, so that ply can be accounted now
+        self.end_ply(board)
+        self.player = 'white' if board.turn == chess.WHITE else 'black'
+
+    def visit_comment(self, comment):
+        if self.player is not None:
+            self.comments.append(comment)
+
+    def begin_variation(self):
+        # Only the mainline is used
+        return chess.pgn.SKIP
+
+    def end_game(self):
+        if self.board is not None:
+            self.end_ply(self.board)
+
+    def end_ply(self, board):
+        if self.player is None or self.is_skipped:
+            return
 
-            if data is not None:
+        comment = ' '.join(filter(None, self.comments))
+        if not self.clock.add_ply(board, self.player, comment):
+            self.is_skipped = True  # No clock time found, skip this whole game
+
+        self.player = None
+        self.comments = []
+
+    def handle_error(self, error):
+        # Like the default GameBuilder, an illegal move ends the mainline there instead of raising
+        pass
+
+    def result(self):
+        # Dropped games come back as SKIP, since read_game's None already means end of file
+        if self.is_skipped:
+            return chess.pgn.SKIP
+
+        data = build_record(self.header_fields, self.clock)
+        return chess.pgn.SKIP if data is None else data
+
+def read_record(pgn, header_filter=None):
+    # Read the next game straight into its CSV row. Returns SKIP for games that were filtered out
+    # and None at the end of the file.
+    return chess.pgn.read_game(pgn, Visitor=functools.partial(GameRecordVisitor, header_filter))
+
+class ThreadedReader(io.RawIOBase):
+    # Reads a binary stream on a background thread, so that decompression overlaps with parsing
+    def __init__(self, source, chunk_size=DECOMPRESS_CHUNK_SIZE, queue_size=DECOMPRESS_QUEUE_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=queue_size)
+        self.chunk = memoryview(b'')
+        self.at_end = False
+        self.error = None
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        try:
+            while True:
+                chunk = self.source.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.chunks.put(chunk)  # Blocks while the parser is behind
+        except Exception as error:
+            self.error = error
+        finally:
+            self.chunks.put(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.chunk:
+            if self.at_end:
+                return 0
+            self.chunk = memoryview(self.chunks.get())
+            if not self.chunk:
+                self.at_end = True
+                if self.error is not None:
+                    raise self.error
+                return 0
+
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        self.source.close()
+        super().close()
+
+def is_seekable_pgn(pgn_file_path):
+    # Only a plain .pgn file can be split into byte ranges up front
+    return pgn_file_path != '-' and not pgn_file_path.endswith('.zst')
+
+def open_pgn(pgn_file_path):
+    # Open a .pgn, a .pgn.zst (decompressed on the fly) or stdin ('-') as a binary stream
+    if pgn_file_path == '-':
+        return sys.stdin.buffer
+
+    if pgn_file_path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit('Reading .pgn.zst files needs the zstandard package (pip install zstandard).')
+
+        source = zstandard.ZstdDecompressor().stream_reader(open(pgn_file_path, 'rb'), read_across_frames=True)
+        return io.BufferedReader(ThreadedReader(source), buffer_size=DECOMPRESS_CHUNK_SIZE)
+
+    return open(pgn_file_path, 'rb')
+
+def find_shard_offsets(pgn_file_path, shard_size=SHARD_SIZE, start=0):
+    # Split the file from start on into byte ranges of roughly shard_size bytes, each starting on an [Event line
+    file_size = os.path.getsize(pgn_file_path)
+    offsets = [start]
+
+    with open(pgn_file_path, 'rb') as pgn:
+        position = start + shard_size
+        while position < file_size:
+            pgn.seek(position)
+            pgn.readline()  # Skip the (probably partial) line we landed in
+            while True:
+                line_start = pgn.tell()
+                line = pgn.readline()
+                if not line:
+                    line_start = file_size
+                    break
+                if line.startswith(b'[Event '):
+                    break
+            if line_start >= file_size:
+                break
+            if line_start > offsets[-1]:
+                offsets.append(line_start)
+            position = line_start + shard_size
+
+    if file_size > start:
+        offsets.append(file_size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def read_stream_shards(pgn, shard_size=SHARD_SIZE):
+    # Cut a stream that cannot be seeked into pieces of at least shard_size bytes, each starting on an [Event line
+    pending = b''
+    while True:
+        block = pgn.read(shard_size)
+        if not block:
+            break
+        pending += block
+
+        cut = pending.rfind(b'\n[Event ')
+        if cut > 0:
+            yield pending[:cut + 1]
+            pending = pending[cut + 1:]
+
+    if pending:
+        yield pending
+
+def skip_stream(pgn, size):
+    # Read past the first size bytes of a stream, e.g. to resume a run on a .pgn.zst or stdin
+    while size > 0:
+        block = pgn.read(min(size, SHARD_SIZE))
+        if not block:
+            break
+        size -= len(block)
+
+def parse_shard(shard, header_filter):
+    # Parse every game in a piece of PGN text and return the processed rows in order,
+    # along with how many games this piece had rejected by each header filter
+    header_filter = header_filter.without_counts()
+    pgn = io.StringIO(shard.decode('utf-8'))
+    rows = []
+
+    while True:
+        data = read_record(pgn, header_filter)
+        if data is None:
+            break
+        if data is not chess.pgn.SKIP:
+            rows.append(data)
+
+    return rows, header_filter.rejected
+
+def process_shard(args):
+    # Task for a byte range of a plain .pgn file, which the worker reads itself
+    pgn_file_path, start, end, header_filter = args
+
+    with open(pgn_file_path, 'rb') as pgn:
+        pgn.seek(start)
+        shard = pgn.read(end - start)
+
+    rows, rejected = parse_shard(shard, header_filter)
+    return rows, rejected, end
+
+def process_stream_shard(args):
+    # Task for a piece of a stream, which the main process has already read
+    shard, end, header_filter = args
+    rows, rejected = parse_shard(shard, header_filter)
+    return rows, rejected, end
+
+def imap_bounded(pool, func, tasks, window):
+    # Like pool.imap, but with at most `window` tasks in flight, so a stream is never read far ahead of the workers
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+def read_shards(pgn_file_path, header_filter, workers=1, start=0, shard_size=SHARD_SIZE):
+    # Parse the PGN from byte offset start on, one piece at a time, on one core or in a pool of workers.
+    # Yields (rows, rejected, end) per piece in the original game order, where end is the input byte
+    # offset (of the decompressed PGN) that the piece ends at.
+    if is_seekable_pgn(pgn_file_path):
+        process = process_shard
+        tasks = (
+            (pgn_file_path, shard_start, shard_end, header_filter)
+            for shard_start, shard_end in find_shard_offsets(pgn_file_path, shard_size, start)
+        )
+    else:
+        process = process_stream_shard
+        tasks = read_stream_tasks(pgn_file_path, header_filter, start, shard_size)
+
+    if workers > 1:
+        with Pool(workers) as pool:
+            yield from imap_bounded(pool, process, tasks, 2 * workers)
+    else:
+        for task in tasks:
+            yield process(task)
+
+def read_stream_tasks(pgn_file_path, header_filter, start, shard_size):
+    with open_pgn(pgn_file_path) as pgn:
+        skip_stream(pgn, start)
+        end = start
+        for shard in read_stream_shards(pgn, shard_size):
+            end += len(shard)
+            yield shard, end, header_filter
+
+def read_rows(pgn_file_path, header_filter, workers=1):
+    # Every processed row of the PGN, in game order
+    for rows, rejected, end in read_shards(pgn_file_path, header_filter, workers):
+        header_filter.add_rejected(rejected)
+        yield from rows
+
+class HashingFile:
+    # Write-only text file that encodes to UTF-8 and keeps a running SHA-256 and size of everything written
+    def __init__(self, binary_file, sha256=None, size=0):
+        self.binary_file = binary_file
+        self.sha256 = sha256 if sha256 is not None else hashlib.sha256()
+        self.size = size
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.binary_file.write(data)
+
+    def flush(self):
+        self.binary_file.flush()
+        os.fsync(self.binary_file.fileno())
+
+def get_checkpoint_path(output_path):
+    return output_path + '.checkpoint.json'
+
+def get_parser_hash():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sha256 = hashlib.sha256()
+    for source in PARSER_SOURCES:
+        with open(os.path.join(directory, source), 'rb') as infile:
+            sha256.update(infile.read())
+    return sha256.hexdigest()
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    # Written to a temporary file first, so an interruption never leaves a half-written checkpoint
+    temporary_path = checkpoint_path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(temporary_path, checkpoint_path)
+
+def open_resumed_output(output_path, checkpoint):
+    # Reopen the output of an interrupted run at the point of its checkpoint, after checking that
+    # the output still starts with exactly what had been written by then
+    output_bytes = checkpoint['output_bytes']
+    sha256 = hashlib.sha256()
+
+    csvfile = open(output_path, 'r+b')
+    remaining = output_bytes
+    while remaining > 0:
+        block = csvfile.read(min(remaining, SHARD_SIZE))
+        if not block:
+            break
+        sha256.update(block)
+        remaining -= len(block)
+
+    if remaining > 0 or sha256.hexdigest() != checkpoint['output_sha256']:
+        csvfile.close()
+        sys.exit(f'{output_path} does not match its checkpoint, so the run can not be resumed. Run it again without --resume.')
+
+    # Drop anything written after the checkpoint, it will be written again
+    csvfile.seek(output_bytes)
+    csvfile.truncate()
+    return HashingFile(csvfile, sha256, output_bytes)
+
+def write_csv(pgn_file_path, output_path, header_filter, workers, resume, checkpoint_interval=CHECKPOINT_INTERVAL,
+              fingerprint=None):
+    # Write the CSV, saving a checkpoint every checkpoint_interval seconds from which --resume can continue.
+    # A caller's fingerprint of the run is saved in the checkpoint as it is, for the caller to check.
+    checkpoint_path = get_checkpoint_path(output_path)
+    checkpoint = None
+    parser_hash = get_parser_hash()
+
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint['input'] != os.path.abspath(pgn_file_path):
+            sys.exit(f'{checkpoint_path} is for {checkpoint["input"]}, not {pgn_file_path}.')
+        if checkpoint.get('fieldnames') != FIELDNAMES:
+            sys.exit(f'{output_path} was written with different columns, so the run can not be resumed. Run it again without --resume.')
+        if checkpoint.get('filter') != header_filter.settings():
+            sys.exit(f'{output_path} was written with different filters, so the run can not be resumed. Run it again without --resume.')
+        if checkpoint.get('parser_sha256') != parser_hash:
+            sys.exit(f'{output_path} was written by a different version of the parser, so the run can not be resumed. Run it again without --resume.')
+    elif resume:
+        print(f'No checkpoint found at {checkpoint_path}, starting from the beginning.')
+
+    if checkpoint is not None:
+        csvfile = open_resumed_output(output_path, checkpoint)
+        input_offset = checkpoint['input_offset']
+        game_count = checkpoint['games_emitted']
+        header_filter.add_rejected(checkpoint['rejected'])
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        print(f'Resuming after {game_count} games, at byte {input_offset} of the input.')
+    else:
+        csvfile = HashingFile(open(output_path, 'wb'))
+        input_offset = 0
+        game_count = 0
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+
+    last_checkpoint = time.monotonic()
+
+    with csvfile.binary_file:
+        for rows, rejected, end in read_shards(pgn_file_path, header_filter, workers, input_offset):
+            for data in rows:
                 writer.writerow(data)
                 game_count += 1
 
                 if game_count % 1000 == 0:
                     print(f'Processed {game_count} games.')
 
-        print(f'Processed {game_count} games in total.')
+            header_filter.add_rejected(rejected)
+
+            # Pieces end on game boundaries, so this is a point the run can restart from
+            if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                csvfile.flush()
+                save_checkpoint(checkpoint_path, {
+                    'input': os.path.abspath(pgn_file_path),
+                    'input_offset': end,
+                    'fieldnames': FIELDNAMES,
+                    'filter': header_filter.settings(),
+                    'parser_sha256': parser_hash,
+                    'games_emitted': game_count,
+                    'output_bytes': csvfile.size,
+                    'output_sha256': csvfile.sha256.hexdigest(),
+                    'rejected': header_filter.rejected,
+                    'fingerprint': fingerprint,
+                })
+                last_checkpoint = time.monotonic()
+
+    print(f'Processed {game_count} games in total.')
+
+    # The run is complete, so there is nothing left to resume
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return game_count, csvfile.sha256.hexdigest()
+
+def add_filter_arguments(parser):
+    parser.add_argument('--time-control', action='append', dest='time_controls',
+                        help='TimeControl header to keep, can be repeated (default: 180+0)')
+    parser.add_argument('--min-elo', type=int, help='skip games where either player is rated below this')
+    parser.add_argument('--max-elo', type=int, help='skip games where either player is rated above this')
+    parser.add_argument('--termination', action='append', dest='terminations',
+                        help='Termination header to keep, can be repeated (default: all)')
+
+def get_header_filter(args):
+    # Filter on the headers before any moves are parsed
+    return HeaderFilter(
+        time_controls=args.time_controls or ['180+0'],
+        min_elo=args.min_elo,
+        max_elo=args.max_elo,
+        terminations=args.terminations,
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compute the per-game attributes of a lichess PGN dump.')
+    parser.add_argument('pgn_file_path', nargs='?', default='../data/lichess_db_chess960_rated_2024-08.pgn',
+                        help='a .pgn or .pgn.zst file, or - to read the PGN from stdin')
+    parser.add_argument('output_path', nargs='?', default='../data/output/project_2_parsed_output.csv',
+                        help='the output CSV, or the output directory with --format npy')
+    parser.add_argument('--format', choices=['csv', 'npy'], default='csv',
+                        help='write a CSV (default), or a directory of typed .npy columns (see columnar_games.py)')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes (default: 1, the serial parser)')
+    add_filter_arguments(parser)
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted CSV run from its last checkpoint')
+    args = parser.parse_args()
+    if args.resume and args.format != 'csv':
+        parser.error('--resume only works with --format csv')
+    return args
+
+def main():
+    args = parse_args()
+
+    # pgn_file_path = '../data/much_shorter_mock_data.pgn'
+    # output_csv_path = '../data/output/short_parsed_output_13_extended.csv'
+
+    header_filter = get_header_filter(args)
+
+    if args.format == 'npy':
+        with ColumnarWriter(args.output_path) as writer:
+            write_games(read_rows(args.pgn_file_path, header_filter, args.workers), writer)
+    else:
+        write_csv(args.pgn_file_path, args.output_path, header_filter, args.workers, args.resume)
+
+    header_filter.report()
+
+def write_games(rows, writer):
+    game_count = 0
+
+    for data in rows:
+        writer.writerow(data)
+        game_count += 1
+
+        if game_count % 1000 == 0:
+            print(f'Processed {game_count} games.')
 
-    pgn.close()
+    print(f'Processed {game_count} games in total.')
 
 if __name__ == '__main__':
     main()
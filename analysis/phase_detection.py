@@ -0,0 +1,125 @@
+"""
+PHASE DETECTION
+
+Middlegame and endgame detection on the board's occupancy bitboards. python-chess
+updates the bitboards on every push, so each question is a mask and a popcount,
+with no piece_map() or square-by-square scan per ply.
+
+Run this file on a PGN to check that it finds the same Middlegame and Endgame
+plies as the original piece_map() scans, on every game.
+"""
+
+import chess
+import chess.pgn
+import sys
+
+# Copyright Josiah Plett 2024
+
+BB_BACK_RANKS = chess.BB_RANK_1 | chess.BB_RANK_8
+BB_MIDDLE_RANKS = chess.BB_RANK_3 | chess.BB_RANK_4 | chess.BB_RANK_5 | chess.BB_RANK_6
+
+
+def count_major_minor_pieces(board):
+    # Queens, rooks, bishops and knights are everything that is not a pawn or a king
+    return chess.popcount(board.occupied & ~(board.pawns | board.kings))
+
+
+def is_middlegame(board):
+    # Condition 1: 10 or fewer major or minor pieces
+    # Condition 2: Back rank is sparse (rows 1 and 8 have fewer than 9 pieces total)
+    # Condition 3: Sufficient mixing (at least 12 pieces or pawns in the middle 4 rows)
+    occupied = board.occupied
+    return (
+        chess.popcount(occupied & ~(board.pawns | board.kings)) <= 10
+        or chess.popcount(occupied & BB_BACK_RANKS) < 9
+        or chess.popcount(occupied & BB_MIDDLE_RANKS) >= 12
+    )
+
+
+def is_endgame(board):
+    # Condition: 6 or fewer major or minor pieces
+    return chess.popcount(board.occupied & ~(board.pawns | board.kings)) <= 6
+
+
+def count_major_minor_pieces_scan(board):
+    # The original piece_map() count, kept as the reference for the differential check
+    major_minor_pieces = 0
+    for piece in board.piece_map().values():
+        if piece.piece_type in [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]:
+            major_minor_pieces += 1
+    return major_minor_pieces
+
+
+def is_middlegame_scan(board):
+    major_minor_pieces = count_major_minor_pieces_scan(board)
+    if major_minor_pieces <= 10:
+        return True
+
+    back_rank_pieces = 0
+    for square in chess.SquareSet(BB_BACK_RANKS):
+        if board.piece_at(square) is not None:
+            back_rank_pieces += 1
+    if back_rank_pieces < 9:
+        return True
+
+    middle_rows_pieces = 0
+    for square in chess.SquareSet(BB_MIDDLE_RANKS):
+        if board.piece_at(square) is not None:
+            middle_rows_pieces += 1
+    if middle_rows_pieces >= 12:
+        return True
+
+    return False
+
+
+def is_endgame_scan(board):
+    return count_major_minor_pieces_scan(board) <= 6
+
+
+def find_phase_plies(game, middlegame_check, endgame_check):
+    # Returns the (Middlegame, Endgame) plies of a game the way do_processing numbers them
+    board = game.board()
+    middlegame_move = -1
+    endgame_move = -1
+
+    for ply, move in enumerate(game.mainline_moves(), start=1):
+        board.push(move)
+        if middlegame_move == -1 and middlegame_check(board):
+            middlegame_move = ply
+        if endgame_move == -1 and endgame_check(board):
+            endgame_move = ply
+
+    return middlegame_move, endgame_move
+
+
+def compare_phase_detection(pgn_file_path):
+    # Differential check of the bitboard functions against the original scans, on every game
+    game_count = 0
+    mismatches = 0
+
+    with open(pgn_file_path, encoding='utf-8') as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            game_count += 1
+
+            expected = find_phase_plies(game, is_middlegame_scan, is_endgame_scan)
+            actual = find_phase_plies(game, is_middlegame, is_endgame)
+            if actual != expected:
+                mismatches += 1
+                print(f'Game {game_count} ({game.headers.get("Site", "?")}): '
+                      f'scan found {expected}, bitboards found {actual}')
+
+    print(f'Compared {game_count} games, {mismatches} mismatches.')
+    return mismatches
+
+
+def main():
+    pgn_file_path = sys.argv[1] if len(sys.argv) > 1 else '../data/lichess_db_chess960_rated_2024-08.pgn'
+    if compare_phase_detection(pgn_file_path):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+PIPELINE
+
+Runs the analysis scripts as stages of one pipeline. Every stage declares the
+files it reads and writes, and is cached by a hash of its inputs and its code
+(the script plus the local modules it imports). A stage only runs again when
+one of those hashes changed or one of its outputs is missing or was changed by
+hand, and stages that do not depend on each other run at the same time.
+
+    python pipeline.py                     # bring every stage up to date
+    python pipeline.py classification_4    # just that stage and what it needs
+    python pipeline.py --dry-run           # list the stale stages
+
+Each stage's output is saved to ../data/output/logs/<stage>.log, and plots are
+rendered without a window (MPLBACKEND=Agg) so the model scripts run unattended.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Copyright Josiah Plett 2024
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_2_DIR = os.path.join(ANALYSIS_DIR, 'project-2-supervised-learning-classification-and-regression')
+OUTPUT_DIR = os.path.join(ANALYSIS_DIR, '..', 'data', 'output')
+LOG_DIR = os.path.join(OUTPUT_DIR, 'logs')
+CACHE_PATH = os.path.join(OUTPUT_DIR, '.pipeline_cache.json')
+
+Stage = namedtuple('Stage', ['name', 'cwd', 'command', 'inputs', 'outputs'])
+
+
+def data(name):
+    return os.path.join(ANALYSIS_DIR, '..', 'data', name)
+
+
+def output(name):
+    return os.path.join(OUTPUT_DIR, name)
+
+
+def log(name):
+    return os.path.join(LOG_DIR, f'{name}.log')
+
+
+def all_games():
+    # classification_1.py reads the parsed games' columns instead of the CSV when they're there
+    columnar_games = output('project_2_parsed_output')
+    return columnar_games if os.path.isdir(columnar_games) else output('project_2_all_games.csv')
+
+
+def model_stage(name, input_csv):
+    # A project 2 script that only reports results; its log is its output
+    return Stage(name, PROJECT_2_DIR, [f'{name}.py'], [input_csv], [log(name)])
+
+
+STAGES = [
+    Stage('pgn_parser', ANALYSIS_DIR, ['pgn_parser.py'],
+          [data('lichess_db_chess960_rated_2024-08.pgn')], [output('project_2_parsed_output.csv')]),
+    Stage('filter_endgames', ANALYSIS_DIR, ['filter_endgames.py'],
+          [output('project_2_parsed_output.csv')],
+          [output('project_2_all_games.csv'), output('project_2_endgame_games.csv')]),
+    Stage('total_win_percentages', ANALYSIS_DIR, ['total_win_percentages.py'],
+          [output('project_2_all_games.csv')], [log('total_win_percentages')]),
+    Stage('losing_on_time', ANALYSIS_DIR, ['losing_on_time.py'],
+          [output('project_2_all_games.csv')], [log('losing_on_time')]),
+    Stage('simplification_utility', ANALYSIS_DIR,
+          ['simplification_utility.py', output('project_2_all_games.csv'), output('project_2_part_a_1_pre.csv')],
+          [output('project_2_all_games.csv')], [output('project_2_part_a_1_pre.csv')]),
+    Stage('regression_part_A_1', PROJECT_2_DIR, ['regression_part_A_1.py'],
+          [output('project_2_part_a_1_pre.csv')],
+          [output('project_2_part_a_standardized.csv'), output('project_2_part_a_scaler.json')]),
+    model_stage('regression_part_A_2', output('project_2_part_a_standardized.csv')),
+    Stage('regression_part_A_3', PROJECT_2_DIR, ['regression_part_A_3.py'],
+          [output('project_2_part_a_standardized.csv'), output('project_2_part_a_scaler.json')],
+          [log('regression_part_A_3'), output('project_2_game_length_model.json')]),
+    Stage('classification_1', PROJECT_2_DIR, ['classification_1.py'],
+          [all_games()],
+          [output('project_2_classification_standardized.csv'), output('project_2_classification_scaler.json')]),
+    model_stage('classification_baseline', output('project_2_classification_standardized.csv')),
+    model_stage('classification_basic', output('project_2_classification_standardized.csv')),
+    model_stage('classification_2', output('project_2_classification_standardized.csv')),
+    model_stage('classification_3', output('project_2_classification_standardized.csv')),
+    model_stage('classification_4', output('project_2_classification_standardized.csv')),
+    Stage('classification_5', PROJECT_2_DIR, ['classification_5.py'],
+          [output('project_2_classification_standardized.csv'), output('project_2_classification_scaler.json')],
+          [output('project_2_ridge_classifier.json')]),
+]
+
+IMPORT_REGEX = re.compile(r'^\s*(?:from|import)\s+(\w+)', re.MULTILINE)
+
+
+def get_code_files(stage):
+    # The stage's script and, recursively, every module next to it (or in analysis/) that it imports
+    script = os.path.join(stage.cwd, stage.command[0])
+    code_files = []
+    pending = [script]
+    while pending:
+        path = pending.pop()
+        if path in code_files:
+            continue
+        code_files.append(path)
+        with open(path, encoding='utf-8') as source:
+            for module in IMPORT_REGEX.findall(source.read()):
+                for directory in [os.path.dirname(path), ANALYSIS_DIR]:
+                    module_path = os.path.join(directory, f'{module}.py')
+                    if os.path.exists(module_path):
+                        pending.append(module_path)
+                        break
+    return sorted(code_files)
+
+
+class FileHasher:
+    # SHA-256 of files, remembered by (size, mtime) across runs so big inputs are not hashed every time
+    def __init__(self, known):
+        self.known = known
+
+    def hash(self, path):
+        path = os.path.normpath(path)
+        if os.path.isdir(path):
+            # A directory of columns (pgn_parser.py --format npy): the hashes of its files, by name
+            sha256 = hashlib.sha256()
+            for name in sorted(os.listdir(path)):
+                sha256.update(f'{name}:{self.hash(os.path.join(path, name))}'.encode('utf-8'))
+            return sha256.hexdigest()
+
+        stat = os.stat(path)
+        known = self.known.get(path)
+        if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known['sha256']
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(1024 * 1024), b''):
+                sha256.update(block)
+        self.known[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256.hexdigest()}
+        return sha256.hexdigest()
+
+
+def get_stage_key(stage, hasher):
+    # Everything that decides a stage's outputs: its command, its code and its inputs
+    key = hashlib.sha256(json.dumps(stage.command).encode('utf-8'))
+    for path in get_code_files(stage) + stage.inputs:
+        key.update(os.path.relpath(path, ANALYSIS_DIR).encode('utf-8'))
+        key.update(hasher.hash(path).encode('utf-8'))
+    return key.hexdigest()
+
+
+def is_stale(stage, key, cache, hasher):
+    entry = cache.get(stage.name)
+    if entry is None or entry['key'] != key:
+        return True
+    for path in stage.outputs:
+        if not os.path.exists(path) or hasher.hash(path) != entry['outputs'].get(os.path.normpath(path)):
+            return True
+    return False
+
+
+def run_stage(stage):
+    # Runs in a thread; the script itself runs in its own process
+    os.makedirs(LOG_DIR, exist_ok=True)
+    env = dict(os.environ, MPLBACKEND='Agg')
+    start = time.monotonic()
+    with open(log(stage.name), 'w', encoding='utf-8') as stage_log:
+        completed = subprocess.run(
+            [sys.executable] + stage.command, cwd=stage.cwd, env=env,
+            stdin=subprocess.DEVNULL, stdout=stage_log, stderr=subprocess.STDOUT,
+        )
+    return completed.returncode, time.monotonic() - start
+
+
+def get_upstream(stages, targets):
+    # The target stages plus every stage that produces one of their inputs, transitively
+    producers = {os.path.normpath(path): stage for stage in stages for path in stage.outputs}
+    selected = set()
+    pending = list(targets)
+    while pending:
+        stage = pending.pop()
+        if stage.name in selected:
+            continue
+        selected.add(stage.name)
+        for path in stage.inputs:
+            producer = producers.get(os.path.normpath(path))
+            if producer is not None:
+                pending.append(producer)
+    return [stage for stage in stages if stage.name in selected]
+
+
+def load_cache():
+    if not os.path.exists(CACHE_PATH):
+        return {'stages': {}, 'files': {}}
+    with open(CACHE_PATH, encoding='utf-8') as cache_file:
+        return json.load(cache_file)
+
+
+def save_cache(cache):
+    temporary_path = CACHE_PATH + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as cache_file:
+        json.dump(cache, cache_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, CACHE_PATH)
+
+
+def run_pipeline(stages, workers, force=False, dry_run=False):
+    cache = load_cache()
+    hasher = FileHasher(cache['files'])
+    producers = {os.path.normpath(path): stage.name for stage in stages for path in stage.outputs}
+    dependencies = {
+        stage.name: {producers[os.path.normpath(path)] for path in stage.inputs if os.path.normpath(path) in producers}
+        for stage in stages
+    }
+
+    waiting = {stage.name: stage for stage in stages}
+    done = set()
+    failed = set()
+    stale = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while waiting or running:
+            # Start every stage whose upstream stages have all finished
+            for name, stage in list(waiting.items()):
+                if dependencies[name] & failed:
+                    print(f'{name}: skipped, an upstream stage failed.')
+                    failed.add(name)
+                    del waiting[name]
+                elif dependencies[name] <= done:
+                    del waiting[name]
+                    missing = [path for path in stage.inputs if not os.path.exists(path)]
+                    if missing:
+                        print(f'{name}: missing input {missing[0]}.')
+                        failed.add(name)
+                        continue
+
+                    key = get_stage_key(stage, hasher)
+                    if dry_run and (force or dependencies[name] & stale or is_stale(stage, key, cache['stages'], hasher)):
+                        # Without running them, stages below a stale one count as stale too
+                        print(f'{name}: stale.')
+                        stale.add(name)
+                        done.add(name)
+                    elif not force and not is_stale(stage, key, cache['stages'], hasher):
+                        print(f'{name}: up to date.')
+                        done.add(name)
+                    else:
+                        print(f'{name}: running...')
+                        running[executor.submit(run_stage, stage)] = (stage, key)
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                returncode, seconds = future.result()
+                if returncode != 0:
+                    print(f'{stage.name}: failed after {seconds:.1f}s, see {log(stage.name)}.')
+                    failed.add(stage.name)
+                    continue
+
+                cache['stages'][stage.name] = {
+                    'key': key,
+                    'outputs': {os.path.normpath(path): hasher.hash(path) for path in stage.outputs},
+                }
+                save_cache(cache)
+                print(f'{stage.name}: done in {seconds:.1f}s.')
+                done.add(stage.name)
+
+    save_cache(cache)
+    return not failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the stale stages of the analysis pipeline.')
+    parser.add_argument('stages', nargs='*', help='stages to bring up to date (default: all of them)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='number of stages run at the same time (default: one per core)')
+    parser.add_argument('--force', action='store_true', help='run the stages even if they are up to date')
+    parser.add_argument('--dry-run', action='store_true', help='only list which stages are stale')
+    parser.add_argument('--list', action='store_true', help='list the stages and their files')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.list:
+        for stage in STAGES:
+            print(stage.name)
+            for path in stage.inputs:
+                print(f'  <- {os.path.relpath(path, ANALYSIS_DIR)}')
+            for path in stage.outputs:
+                print(f'  -> {os.path.relpath(path, ANALYSIS_DIR)}')
+        return
+
+    stages_by_name = {stage.name: stage for stage in STAGES}
+    unknown = [name for name in args.stages if name not in stages_by_name]
+    if unknown:
+        sys.exit(f'Unknown stage {unknown[0]}, see --list.')
+
+    stages = get_upstream(STAGES, [stages_by_name[name] for name in args.stages]) if args.stages else STAGES
+    if not run_pipeline(stages, args.workers, args.force, args.dry_run):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+"""
+PREDICTION SERVICE
+
+A local HTTP service that predicts a game's Result (classification_5.py's model)
+and its number of plies (regression_part_A_3.py's model). Both artifacts are
+loaded once at startup, so a request costs only the parse of its game and a
+matrix product.
+
+    python prediction_service.py --port 8960
+
+POST /predict takes one JSON object:
+
+    {"pgn": "[Event ...] 1. e4 { [%clk 0:03:00] } ..."}   a partial or complete 3+0 game
+    {"record": {"WhiteElo": "1500", ...}}                   a row of pgn_parser.py's output
+    {"features": [0.0, ...]}                                classification_5.py's features, in the
+                                                            artifact's order (Result only)
+
+A PGN goes through pgn_parser.read_record, so its Middlegame and Endgame plies
+come from the same phase detection as the parsed dataset. Requests are collected
+by one batching thread and predicted together: whatever is waiting when the
+previous batch finishes (plus --batch-wait-ms, if set) goes in the next batch.
+
+GET /metrics returns p50/p99 latency, throughput and batch sizes; GET /health
+returns the loaded model versions.
+"""
+
+import argparse
+import collections
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import chess.pgn
+import numpy as np
+
+from pgn_parser import HeaderFilter, read_record
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'project-2-supervised-learning-classification-and-regression'))
+import classification_5  # noqa: E402
+from classification_1 import INPUT_COLUMNS  # noqa: E402
+
+# Copyright Josiah Plett 2024
+
+# Bumped whenever regression_part_A_3.py's artifact layout changes
+LENGTH_MODEL_FORMAT_VERSION = 1
+
+# The columns of pgn_parser.py's output a record needs; filter_endgames.py's TotalPlies is taken for TotalMoves
+RECORD_COLUMNS = [col for col in INPUT_COLUMNS if col not in ('Result', 'TotalPlies')] + [
+    'TotalMoves', 'WhiteTotalTime', 'BlackTotalTime'
+]
+
+MAX_BATCH = 64
+
+# Latencies kept for the percentiles, and the window throughput is measured over
+LATENCY_WINDOW = 10_000
+THROUGHPUT_WINDOW = 60
+
+class RequestError(Exception):
+    # A request that can't be predicted, with the HTTP status to answer it with
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def load_length_model(artifact_path):
+    with open(artifact_path, 'r', encoding='utf-8') as infile:
+        artifact = json.load(infile)
+    if artifact.get('format_version') != LENGTH_MODEL_FORMAT_VERSION:
+        sys.exit(f'{artifact_path} is in artifact format {artifact.get("format_version")}, '
+                 f'this service reads format {LENGTH_MODEL_FORMAT_VERSION}. Run regression_part_A_3.py again.')
+    return artifact
+
+class Models:
+    # Both models, with their coefficients as arrays so a batch is one matrix product per model
+    def __init__(self, outcome_path, length_path):
+        self.outcome = classification_5.load_artifact(outcome_path)
+        self.length = load_length_model(length_path)
+
+        standardization = self.length['standardization']
+        self.length_features = self.length['features']
+        self.length_mean = np.array([standardization['mean'][col] for col in self.length_features])
+        self.length_std = np.array([standardization['std'][col] for col in self.length_features])
+        self.length_coef = np.array(self.length['coef'])
+        self.target_mean = standardization['mean'][self.length['target']]
+        self.target_std = standardization['std'][self.length['target']]
+
+    def versions(self):
+        return {'outcome_model': self.outcome['model_version'], 'length_model_alpha': self.length['alpha']}
+
+    def prepare(self, request):
+        """
+        A parsed request as the rows its batch needs: the outcome model's features, and the game length
+        model's standardized features when the request is a game rather than a feature vector.
+        """
+        if 'features' in request:
+            return {'outcome': request['features'], 'length': None}
+
+        record = request['record']
+        try:
+            outcome = classification_5.record_features(self.outcome, record)
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as error:
+            raise RequestError(422, f'the game cannot be predicted: {error}')
+
+        # Standardized like regression_part_A_1.py, where missing or invalid values become 0.0
+        length = []
+        for col, mean, std in zip(self.length_features, self.length_mean, self.length_std):
+            try:
+                length.append((float(record[col]) - mean) / std)
+            except (TypeError, ValueError):
+                length.append(0.0)
+        return {'GameId': record.get('GameId', ''), 'outcome': outcome, 'length': length}
+
+    def predict_batch(self, prepared):
+        # The response of every prepared request, predicting the whole batch with one product per model
+        outcomes = classification_5.predict_features(self.outcome, np.array([item['outcome'] for item in prepared]))
+
+        games = [i for i, item in enumerate(prepared) if item['length'] is not None]
+        lengths = {}
+        if games:
+            standardized = np.array([prepared[i]['length'] for i in games])
+            predicted = (standardized @ self.length_coef + self.length['intercept']) * self.target_std + self.target_mean
+            lengths = dict(zip(games, predicted.tolist()))
+
+        results = []
+        for i, (item, outcome) in enumerate(zip(prepared, outcomes.tolist())):
+            if i in lengths:
+                results.append({'GameId': item['GameId'], 'PredictedResult': outcome, 'PredictedTotalPlies': lengths[i]})
+            else:
+                results.append({'PredictedResult': outcome})
+        return results
+
+class PendingPrediction:
+    def __init__(self, request):
+        self.request = request
+        self.result = None
+        self.done = threading.Event()
+
+class MicroBatcher:
+    # Hands the requests of all the handler threads to one thread that predicts them in batches
+    def __init__(self, predict_batch, max_batch=MAX_BATCH, max_wait=0.0):
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        self.batch_sizes = collections.Counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        pending = PendingPrediction(request)
+        self.pending.put(pending)
+        pending.done.wait()
+        if isinstance(pending.result, Exception):
+            raise pending.result
+        return pending.result
+
+    def next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                timeout = deadline - time.monotonic()
+                batch.append(self.pending.get(timeout=timeout) if timeout > 0 else self.pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                results = self.predict_batch([pending.request for pending in batch])
+            except Exception as error:
+                results = [error] * len(batch)
+            self.batch_sizes[len(batch)] += 1
+            for pending, result in zip(batch, results):
+                pending.result = result
+                pending.done.set()
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.finished = collections.deque()  # Finish times within the throughput window
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, latency, failed):
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            self.errors += failed
+            self.latencies.append(latency)
+            self.finished.append(now)
+            while self.finished[0] < now - THROUGHPUT_WINDOW:
+                self.finished.popleft()
+
+    def snapshot(self, batch_sizes):
+        now = time.monotonic()
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            recent = sum(1 for finished in self.finished if finished >= now - THROUGHPUT_WINDOW)
+            snapshot = {'requests': self.requests, 'errors': self.errors}
+        window = min(THROUGHPUT_WINDOW, now - self.started)
+        snapshot.update({
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'throughput_per_s': recent / window if window > 0 else 0.0,
+            'batches': sum(batch_sizes.values()),
+            'mean_batch_size': (sum(size * count for size, count in batch_sizes.items()) / sum(batch_sizes.values())
+                                if batch_sizes else None),
+            'max_batch_size': max(batch_sizes, default=None),
+        })
+        return snapshot
+
+def parse_request(body, feature_count):
+    # The request as {'record': ...} or {'features': ...}, parsing a PGN into its record
+    try:
+        request = json.loads(body)
+    except ValueError:
+        raise RequestError(400, 'the body is not JSON')
+    if not isinstance(request, dict):
+        raise RequestError(400, 'the body must be a JSON object')
+
+    if 'pgn' in request:
+        if not isinstance(request['pgn'], str):
+            raise RequestError(400, 'pgn must be a string')
+        # The models were fitted on 3+0 games, which is what the default filter keeps
+        record = read_record(io.StringIO(request['pgn']), HeaderFilter())
+        if record is None:
+            raise RequestError(422, 'no game found in the PGN')
+        if record is chess.pgn.SKIP:
+            raise RequestError(422, 'the game is not 3+0, has fewer than 9 plies, or is missing clock times')
+        return {'record': record}
+    if 'record' in request:
+        record = request['record']
+        if not isinstance(record, dict):
+            raise RequestError(400, 'record must be a JSON object')
+        if 'TotalMoves' not in record and 'TotalPlies' in record:
+            record = {('TotalMoves' if key == 'TotalPlies' else key): value for key, value in record.items()}
+        missing = [col for col in RECORD_COLUMNS if col not in record]
+        if missing:
+            raise RequestError(400, f'record is missing {", ".join(missing)}')
+        return {'record': record}
+    if 'features' in request:
+        features = request['features']
+        if not isinstance(features, list) or len(features) != feature_count:
+            raise RequestError(400, f'features must be a list of {feature_count} numbers')
+        try:
+            return {'features': [float(value) for value in features]}
+        except (TypeError, ValueError):
+            raise RequestError(400, f'features must be a list of {feature_count} numbers')
+    raise RequestError(400, 'the body needs a "pgn", "record" or "features" key')
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    # server.models, server.batcher and server.metrics are set by make_server
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', **self.server.models.versions()})
+        elif self.path == '/metrics':
+            self.send_json(200, self.server.metrics.snapshot(self.server.batcher.batch_sizes))
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        start = time.monotonic()
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            request = parse_request(body, len(self.server.models.outcome['features']))
+            status, response = 200, self.server.batcher.submit(self.server.models.prepare(request))
+        except RequestError as error:
+            status, response = error.status, {'error': str(error)}
+        except Exception as error:
+            status, response = 500, {'error': f'{type(error).__name__}: {error}'}
+
+        self.send_json(status, response)
+        self.server.metrics.record(time.monotonic() - start, status != 200)
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Per-request logging would cost more than the prediction; /metrics reports on the requests instead
+        pass
+
+def make_server(host, port, models, max_batch=MAX_BATCH, max_wait=0.0):
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    server.daemon_threads = True
+    server.models = models
+    server.batcher = MicroBatcher(models.predict_batch, max_batch, max_wait)
+    server.metrics = Metrics()
+    return server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve game Result and length predictions over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8960)
+    parser.add_argument('--outcome-model', default='../data/output/project_2_ridge_classifier.json',
+                        help='the artifact saved by classification_5.py (default: %(default)s)')
+    parser.add_argument('--length-model', default='../data/output/project_2_game_length_model.json',
+                        help='the artifact saved by regression_part_A_3.py (default: %(default)s)')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH,
+                        help='most requests predicted together (default: %(default)s)')
+    parser.add_argument('--batch-wait-ms', type=float, default=0.0,
+                        help='how long a batch waits for more requests before it is predicted (default: %(default)s)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    models = Models(args.outcome_model, args.length_model)
+    server = make_server(args.host, args.port, models, args.max_batch, args.batch_wait_ms / 1000)
+    print(f'Serving outcome model {models.outcome["model_version"]} and the game length model '
+          f'on http://{args.host}:{args.port}/predict')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
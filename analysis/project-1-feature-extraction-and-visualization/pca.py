@@ -1,8 +1,10 @@
 # exercise 2.1.1
+import argparse
 import matplotlib.pyplot as plt
 import os
 import numpy as np
 import csv
+import json
 from scipy.linalg import svd
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -17,11 +19,11 @@ relevant_attributes = {
     "Result"
 }
 
-# Read data from csv
-with open(f"{dir_path}/../data/output/parsed_output.csv") as csvfile:
-    reader = csv.reader(csvfile)
+CHUNK_SIZE = 100_000
 
-    # find which elements of the row to not prune
+
+def read_header(reader):
+    # find which elements of the row to not prune; Result (the first kept column) is the class
     attribute_names = next(reader)
     kept_indices = []
     for i in range(len(attribute_names)):
@@ -29,36 +31,199 @@ with open(f"{dir_path}/../data/output/parsed_output.csv") as csvfile:
         if attr in relevant_attributes:
             kept_indices.append(i)
     attribute_names = [attribute_names[i] for i in kept_indices][1:]
+    return attribute_names, kept_indices
 
-    data_matrix = []
-    for row in reader:
-        data_matrix.append([row[i] for i in kept_indices])
-    data_matrix = np.asarray(data_matrix)
 
-# Extract and encode classes
-class_labels = [str(class_name) for class_name in data_matrix[:, 0]]
-class_names = sorted(set(class_labels))
-class_dict = dict(zip(class_names, range(len(class_names))))
+def load_data(csv_path):
+    # Read data from csv, keeping only the relevant attributes
+    with open(csv_path) as csvfile:
+        reader = csv.reader(csvfile)
+        attribute_names, kept_indices = read_header(reader)
 
-# Get vector y
-y = np.asarray([class_dict[label] for label in class_labels])
+        # The labels as strings and the attributes straight to floats, so every game fits in memory
+        class_labels = []
+        values = []
+        for row in reader:
+            class_labels.append(row[kept_indices[0]])
+            values.append([float(row[i]) for i in kept_indices[1:]])
 
-# Get matrix X
-X = data_matrix[:, 1:].astype(np.float32)
-X = (X - X.mean(axis=0)) / X.std(axis = 0)
+    return attribute_names, class_labels, np.asarray(values, dtype=np.float32).reshape(-1, len(attribute_names))
 
-# Get N, M, C
-N = len(y)
-M = len(attribute_names)
-C = len(class_names)
 
-# Subtract mean from data
-Y = X - X.mean(axis=0).T
-Y = Y[:45000, :]
+def read_chunks(csv_path):
+    # The relevant attributes of CHUNK_SIZE games at a time, without holding the file in memory
+    with open(csv_path) as csvfile:
+        reader = csv.reader(csvfile)
+        attribute_names, kept_indices = read_header(reader)
+
+        values = []
+        for row in reader:
+            values.append([float(row[i]) for i in kept_indices[1:]])
+            if len(values) == CHUNK_SIZE:
+                yield attribute_names, np.asarray(values)
+                values = []
+        if values:
+            yield attribute_names, np.asarray(values)
+
+
+def pca_covariance(Y):
+    """
+    Principal components from the M x M matrix Y^T Y of the centered data, so the memory used
+    depends on the number of attributes, not games. Its eigenvalues are the squared singular values of Y.
+    """
+    # Summed a chunk of rows at a time in float64, so there's no float64 copy of the whole data
+    scatter = np.zeros((Y.shape[1], Y.shape[1]))
+    for start in range(0, len(Y), CHUNK_SIZE):
+        chunk = np.asarray(Y[start:start + CHUNK_SIZE], dtype=np.float64)
+        scatter += chunk.T @ chunk
+    eigenvalues, eigenvectors = np.linalg.eigh(scatter)
+
+    # eigh sorts ascending; rounding can leave tiny negative eigenvalues where the variance is zero
+    order = np.argsort(eigenvalues)[::-1]
+    S = np.sqrt(np.clip(eigenvalues[order], 0, None))
+    return S, eigenvectors[:, order]
+
+
+def pca_svd(Y):
+    # The thin SVD of the centered data: U is N x M rather than N x N
+    U, S, Vh = svd(Y, full_matrices=False)
+    return S, Vh.T
+
+
+def flip_signs(V):
+    # A component's sign is arbitrary; make each one's largest coefficient positive so the solvers agree
+    signs = np.sign(V[np.abs(V).argmax(axis=0), range(V.shape[1])])
+    signs[signs == 0] = 1
+    return V * signs
+
+
+def get_statistics(attribute_names, values):
+    # The count, mean and scatter matrix (sum of outer products of the centered rows) of some games
+    mean = values.mean(axis=0)
+    centered = values - mean
+    return {"attributes": attribute_names, "count": len(values), "mean": mean, "scatter": centered.T @ centered}
+
+
+def merge_statistics(a, b):
+    """
+    The statistics of two sets of games together, from each set's own (Chan et al.'s parallel update),
+    so chunks and separately computed partitions (e.g. months) can be combined in any order.
+    """
+    if a["attributes"] != b["attributes"]:
+        raise ValueError(f"can't merge statistics of {a['attributes']} with {b['attributes']}")
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    return {
+        "attributes": a["attributes"],
+        "count": count,
+        "mean": a["mean"] + delta * b["count"] / count,
+        "scatter": a["scatter"] + b["scatter"] + np.outer(delta, delta) * a["count"] * b["count"] / count,
+    }
+
+
+def stream_statistics(csv_path):
+    # One pass over the file a chunk at a time; only the M x M statistics are kept between chunks
+    statistics = None
+    for attribute_names, values in read_chunks(csv_path):
+        chunk_statistics = get_statistics(attribute_names, values)
+        statistics = chunk_statistics if statistics is None else merge_statistics(statistics, chunk_statistics)
+        print(f"{csv_path}: {statistics['count']} games")
+    return statistics
+
+
+def save_statistics(statistics, json_path):
+    with open(json_path, "w", encoding="utf-8") as outfile:
+        json.dump({
+            "attributes": statistics["attributes"],
+            "count": statistics["count"],
+            "mean": statistics["mean"].tolist(),
+            "scatter": statistics["scatter"].tolist(),
+        }, outfile, indent=2)
+
 
-# SVD
-U, S, Vh = svd(Y, full_matrices=True)
-V = Vh.T
+def load_statistics(json_path):
+    with open(json_path, "r", encoding="utf-8") as infile:
+        statistics = json.load(infile)
+    statistics["mean"] = np.array(statistics["mean"])
+    statistics["scatter"] = np.array(statistics["scatter"])
+    return statistics
+
+
+def pca_statistics(statistics):
+    """
+    The principal components of the standardized games from their merged statistics. Standardizing
+    divides the scatter matrix by the standard deviations on both sides, which gives the same Y^T Y
+    pca_covariance decomposes.
+    """
+    std = np.sqrt(np.diag(statistics["scatter"]) / statistics["count"])
+    eigenvalues, eigenvectors = np.linalg.eigh(statistics["scatter"] / np.outer(std, std))
+
+    order = np.argsort(eigenvalues)[::-1]
+    S = np.sqrt(np.clip(eigenvalues[order], 0, None))
+    return S, eigenvectors[:, order]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PCA of the parsed games' Elo and phase attributes.")
+    parser.add_argument("csv_paths", nargs="*", default=[f"{dir_path}/../data/output/parsed_output.csv"],
+                        help="parsed games CSVs; only --stream reads more than one")
+    parser.add_argument("--solver", choices=["covariance", "svd"], default="covariance",
+                        help="eigendecomposition of the covariance matrix (default), or a thin SVD of the data")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the CSVs in chunks, keeping only their merged statistics in memory")
+    parser.add_argument("--partials", nargs="+", default=[],
+                        help="statistics saved by --save-partial to merge in (implies --stream)")
+    parser.add_argument("--save-partial", help="save the merged statistics to this JSON file")
+    args = parser.parse_args()
+    if args.partials:
+        args.stream = True
+        if args.csv_paths == parser.get_default("csv_paths"):
+            args.csv_paths = []
+    if not args.stream and len(args.csv_paths) > 1:
+        parser.error("more than one CSV needs --stream")
+    if args.save_partial and not args.stream:
+        parser.error("--save-partial needs --stream")
+    return args
+
+
+def streamed_pca(args):
+    # Every CSV and saved partial merged into one set of statistics, then decomposed
+    statistics = None
+    for part in [stream_statistics(path) for path in args.csv_paths] + [load_statistics(path) for path in args.partials]:
+        statistics = part if statistics is None else merge_statistics(statistics, part)
+
+    if args.save_partial:
+        save_statistics(statistics, args.save_partial)
+    print(f"PCA of {statistics['count']} games")
+    S, V = pca_statistics(statistics)
+    return statistics["attributes"], S, V
+
+
+def in_memory_pca(args):
+    attribute_names, class_labels, X = load_data(args.csv_paths[0])
+
+    # Extract and encode classes
+    class_names = sorted(set(class_labels))
+    class_dict = dict(zip(class_names, range(len(class_names))))
+
+    # Get vector y
+    y = np.asarray([class_dict[label] for label in class_labels])
+
+    # Get matrix X
+    X = (X - X.mean(axis=0)) / X.std(axis = 0)
+
+    # Subtract mean from data
+    Y = X - X.mean(axis=0).T
+
+    # PCA over every game
+    S, V = pca_covariance(Y) if args.solver == "covariance" else pca_svd(Y)
+    return attribute_names, S, V
+
+
+args = parse_args()
+attribute_names, S, V = streamed_pca(args) if args.stream else in_memory_pca(args)
+V = flip_signs(V)
+M = len(attribute_names)
 
 # Get variance via principal components
 rho = (S * S) / (S * S).sum()
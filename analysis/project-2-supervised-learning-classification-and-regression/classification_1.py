@@ -9,138 +9,209 @@ Input Features + Transformations
 - Black + White Opening/Middlegame/Endgame times: Normalize between 0 and 1
 """
 
-import csv
-import math
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import columnar_games
 
 # Copyright Josiah Plett 2024
 
-class Stats:
-    def __init__(self):
-        self.min = math.inf
-        self.max = -math.inf
-    def __repr__(self):
-        return f"Stats(min={self.min}, max={self.max})"
-
-def get_column_stats(data, columns):
-    stats = {column: Stats() for column in columns}
-    # find mins and maxes
-    for row in data:
-        for column in columns:
-            stats[column].min = min(stats[column].min, float(row[column]))
-            stats[column].max = max(stats[column].max, float(row[column]))
-    return stats
+COLUMNS_TO_NORMALIZE = [
+    "EloDifference",
+    "TotalPlies",
+    "OpeningPlies",
+    "MiddlegamePlies",
+    "EndgamePlies",
+    "WhiteOpeningTime",
+    "BlackOpeningTime",
+    "WhiteMiddlegameTime",
+    "BlackMiddlegameTime",
+    "WhiteEndgameTime",
+    "BlackEndgameTime"
+]
+
+# The columns of project_2_all_games.csv this script reads
+INPUT_COLUMNS = [
+    "Result", "EloDifference", "Termination", "WhiteTimes", "BlackTimes", "TotalPlies", "Middlegame",
+    "Endgame", "WhiteOpeningTime", "BlackOpeningTime", "WhiteMiddlegameTime", "BlackMiddlegameTime",
+    "WhiteEndgameTime", "BlackEndgameTime"
+]
+
+# The Result and Termination values process_games one-hot encodes; any other value is an error
+RESULT_VALUES = ["-1", "0", "1"]
+TERMINATIONS = ["Normal", "Time forfeit"]
+
+# A move time list like "[3, 0, -1.5]" with a value below zero in it (-0 and -0.0 aren't below zero)
+NEGATIVE_TIME_REGEX = r"(?:\[|, )-(?=[^,\]]*[1-9])"
+
+# The games as `pgn_parser.py --format npy` writes them; read in place of the CSV when it's there
+COLUMNAR_GAMES = "../../data/output/project_2_parsed_output"
+
+
+def load_games(input_path):
+    # Only the columns we use, from a CSV all as the original strings; the cleaning below decides how to
+    # read them. A directory is read as columns instead, see load_columnar_games.
+    if os.path.isdir(input_path):
+        return load_columnar_games(input_path)
+    return pd.read_csv(input_path, usecols=INPUT_COLUMNS, dtype=str, keep_default_na=False, encoding="utf-8")
+
+
+def load_columnar_games(directory, extra_columns=()):
+    """
+    The games of a pgn_parser.py --format npy directory, as load_games reads project_2_all_games.csv:
+    with filter_endgames.py's renaming and middlegame times, typed instead of strings, and with
+    NegativeTimes in place of the move times, worked out on their arrays.
+    """
+    games = columnar_games.load_games(directory, columns=[
+        column for column in INPUT_COLUMNS + list(extra_columns) + ["TotalMoves", "WhiteTotalTime", "BlackTotalTime"]
+        if column != "TotalPlies"
+    ])
+
+    loaded = pd.DataFrame({column: games[column] for column in list(extra_columns)})
+    loaded["Result"] = games["Result"].astype(str)
+    loaded["EloDifference"] = np.where(games["EloDifference"] == columnar_games.MISSING_INT, np.nan, games["EloDifference"])
+    loaded["Termination"] = games["Termination"]
+    loaded["NegativeTimes"] = (
+        columnar_games.any_per_game(games["WhiteTimes"] < 0, games["WhiteTimesOffsets"])
+        | columnar_games.any_per_game(games["BlackTimes"] < 0, games["BlackTimesOffsets"])
+    )
+    loaded["TotalPlies"] = games["TotalMoves"]
+    for column in ["Middlegame", "Endgame", "WhiteOpeningTime", "BlackOpeningTime", "WhiteMiddlegameTime",
+                   "BlackMiddlegameTime", "WhiteEndgameTime", "BlackEndgameTime"]:
+        loaded[column] = games[column]
+
+    # filter_endgames.py's middlegame time for a game without an endgame, rounded by round() like it is
+    no_endgame = games["Endgame"] == -1
+    for player in ["White", "Black"]:
+        middlegame_time = [round(value, 4) for value in games[f"{player}TotalTime"] - games[f"{player}OpeningTime"]]
+        loaded[f"{player}MiddlegameTime"] = np.where(no_endgame, middlegame_time, games[f"{player}MiddlegameTime"])
+    return loaded
+
+
+def clean_games(games):
+    """
+    Drop the games with a negative move time and derive the feature columns, before normalization.
+    """
+    # skip if white or black times has negative values
+    if "NegativeTimes" in games:
+        negative_times = games["NegativeTimes"]
+    else:
+        negative_times = (
+            games["WhiteTimes"].str.contains(NEGATIVE_TIME_REGEX)
+            | games["BlackTimes"].str.contains(NEGATIVE_TIME_REGEX)
+        )
+    games = games[~negative_times]
+
+    cleaned = pd.DataFrame(index=games.index)
+    cleaned["Result"] = games["Result"]
+    cleaned["Termination"] = games["Termination"]
+
+    # Set new column to which player was higher rated, and make elo diff absolute
+    elo_difference = games["EloDifference"].astype(float)
+    cleaned["BetterPlayer"] = (elo_difference >= 0).astype(int)
+    cleaned["EloDifference"] = elo_difference.abs()
+
+    # convert Middlegame and Endgame columns to
+    # OpeningPlies, MiddlegamePlies, EndgamePlies as fractions of TotalPlies
+    total_plies = games["TotalPlies"].astype(int)
+    middlegame = games["Middlegame"].astype(int)
+    endgame = games["Endgame"].astype(int)
+    no_endgame = endgame == -1
+    cleaned["TotalPlies"] = total_plies
+    cleaned["OpeningPlies"] = middlegame / total_plies
+    cleaned["MiddlegamePlies"] = np.where(no_endgame, total_plies - middlegame, endgame - middlegame) / total_plies
+    cleaned["EndgamePlies"] = np.where(no_endgame, 0, total_plies - endgame) / total_plies
+
+    for column in ["WhiteOpeningTime", "BlackOpeningTime", "WhiteMiddlegameTime", "BlackMiddlegameTime"]:
+        cleaned[column] = games[column].astype(float)
+    # clean -1's in endgame time cols
+    for column in ["WhiteEndgameTime", "BlackEndgameTime"]:
+        endgame_time = games[column].astype(float)
+        cleaned[column] = endgame_time.mask(endgame_time == -1, 0.0)
+
+    return cleaned
+
+
+def get_column_stats(cleaned, columns):
+    # The min and max of every column, which is all normalization needs to be repeated on new games
+    return {
+        "min": cleaned[columns].min().to_dict(),
+        "max": cleaned[columns].max().to_dict(),
+    }
+
+
+def process_games(cleaned, column_stats):
+    """
+    Turn cleaned games into the model's features: one-hot result and termination, and the other
+    columns normalized between 0 and 1 with the given min and max.
+    """
+    if not cleaned["Result"].isin(RESULT_VALUES).all():
+        raise Exception("Invalid Result value")
+    if not cleaned["Termination"].isin(TERMINATIONS).all():
+        raise Exception("invalid termination type")
+
+    processed = pd.DataFrame(index=cleaned.index)
+
+    # Pass on better player info
+    processed["BetterPlayer"] = cleaned["BetterPlayer"]
+
+    # one-hot encode result
+    processed["ResultBlackWin"] = (cleaned["Result"] == "-1").astype(int)
+    processed["ResultDraw"] = (cleaned["Result"] == "0").astype(int)
+    processed["ResultWhiteWin"] = (cleaned["Result"] == "1").astype(int)
+
+    # normalization
+    columns = list(column_stats["min"])
+    minimum = pd.Series(column_stats["min"])[columns]
+    maximum = pd.Series(column_stats["max"])[columns]
+    processed[columns] = (cleaned[columns].astype(float) - minimum) / (maximum - minimum)
+
+    # one-hot encode termination
+    processed["TerminationNormal"] = (cleaned["Termination"] == "Normal").astype(int)
+    processed["TerminationTimeForfeit"] = (cleaned["Termination"] == "Time forfeit").astype(int)
+
+    return processed
+
+
+def save_column_stats(column_stats, stats_json):
+    with open(stats_json, "w", encoding="utf-8") as outfile:
+        json.dump(column_stats, outfile, indent=2)
+
+
+def load_column_stats(stats_json):
+    with open(stats_json, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
 
 def main():
-    input_csv = "../../data/output/project_2_all_games.csv"
+    input_csv = COLUMNAR_GAMES if os.path.isdir(COLUMNAR_GAMES) else "../../data/output/project_2_all_games.csv"
     output_csv = "../../data/output/project_2_classification_standardized.csv"
-
-    # Read data from CSV
-    with open(input_csv, "r", encoding="utf-8") as infile:
-        reader = csv.DictReader(infile)
-        data = list(reader)
-
-    # clean/reformat columns
-    cleaned_data = []
-    for row in data:
-        # skip if white or black times has negative values
-        skip = False
-        for time in map(float, row["WhiteTimes"][1:-1].split(", ")):
-            if time < 0:
-                skip = True
-                break
-        if skip:
-            continue
-        for time in map(float, row["BlackTimes"][1:-1].split(", ")):
-            if time < 0:
-                skip = True
-                break
-        if skip:
-            continue
-
-        # Set new column to which player was higher rated
-        row["BetterPlayer"] = 1 if float(row["EloDifference"]) >= 0 else 0
-        # make elo diff absolute
-        row["EloDifference"] = abs(float(row["EloDifference"]))
-        
-        # clean -1's in endgame time cols
-        if row["WhiteEndgameTime"] == "-1":
-            row["WhiteEndgameTime"] = 0
-        if row["BlackEndgameTime"] == "-1":
-            row["BlackEndgameTime"] = 0
-
-        # convert Middlegame and Endgame columns to
-        # OpeningPlies, MiddlegamePlies, EndgamePlies
-        row["OpeningPlies"] = int(row["Middlegame"])
-        if row["Endgame"] == "-1":
-            row["MiddlegamePlies"] = int(row["TotalPlies"]) - int(row["OpeningPlies"])
-            row["EndgamePlies"] = 0
-        else:
-            row["MiddlegamePlies"] = int(row["Endgame"]) - int(row["OpeningPlies"])
-            row["EndgamePlies"] = int(row["TotalPlies"]) - int(row["Endgame"])
-        row["OpeningPlies"] /= int(row["TotalPlies"])
-        row["MiddlegamePlies"] /= int(row["TotalPlies"])
-        row["EndgamePlies"] /= int(row["TotalPlies"])
-
-        cleaned_data.append(row)
-
-    columns_to_normalize = [
-        "EloDifference",
-        "TotalPlies",
-        "OpeningPlies",
-        "MiddlegamePlies",
-        "EndgamePlies",
-        "WhiteOpeningTime",
-        "BlackOpeningTime",
-        "WhiteMiddlegameTime",
-        "BlackMiddlegameTime",
-        "WhiteEndgameTime",
-        "BlackEndgameTime"
-    ]
-    column_stats = get_column_stats(cleaned_data, columns_to_normalize)
+    stats_json = "../../data/output/project_2_classification_scaler.json"
+
+    # To process new games with the min and max saved earlier, pass the paths:
+    # python classification_1.py new_games.csv new_output.csv project_2_classification_scaler.json
+    # (new_games.csv can also be a directory written by pgn_parser.py --format npy)
+    reuse_stats = len(sys.argv) > 1
+    if reuse_stats:
+        input_csv, output_csv, stats_json = sys.argv[1:4]
+
+    cleaned = clean_games(load_games(input_csv))
+
+    if reuse_stats:
+        column_stats = load_column_stats(stats_json)
+    else:
+        column_stats = get_column_stats(cleaned, COLUMNS_TO_NORMALIZE)
+        save_column_stats(column_stats, stats_json)
     print(column_stats)
 
-    # Processed data
-    processed_data = []
-    for row in cleaned_data:
-        processed_row = {}
-
-        # Pass on better player info
-        processed_row["BetterPlayer"] = row["BetterPlayer"]
-
-        # one-hot encode result
-        processed_row["ResultBlackWin"] = 0
-        processed_row["ResultDraw"] = 0
-        processed_row["ResultWhiteWin"] = 0
-        if row["Result"] == "-1":
-            processed_row["ResultBlackWin"] = 1
-        elif row["Result"] == "0":
-            processed_row["ResultDraw"] = 1
-        elif row["Result"] == "1":
-            processed_row["ResultWhiteWin"] = 1
-        else:
-            raise Exception("Invalid Result value")
-
-        # normalization
-        for column in columns_to_normalize:
-            processed_row[column] = (float(row[column]) - column_stats[column].min) / (column_stats[column].max - column_stats[column].min)
-
-        # one-hot encode termination
-        if row["Termination"] == "Normal":
-            processed_row["TerminationNormal"] = 1
-            processed_row["TerminationTimeForfeit"] = 0
-        elif row["Termination"] == "Time forfeit":
-            processed_row["TerminationNormal"] = 0
-            processed_row["TerminationTimeForfeit"] = 1
-        else:
-            raise Exception("invalid termination type")
-
-        processed_data.append(processed_row)
-
     # Write processed data to new CSV
-    with open(output_csv, "w", newline="", encoding="utf-8") as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=processed_data[0].keys())
-        writer.writeheader()
-        writer.writerows(processed_data)
+    process_games(cleaned, column_stats).to_csv(output_csv, index=False, lineterminator="\r\n")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,12 @@
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import RidgeClassifier
-from sklearn.model_selection import KFold, cross_val_score
+from sklearn.model_selection import KFold
 import matplotlib.pyplot as plt
 
+from cv_executor import CVExecutor
+from ridge_path import ridge_classifier_path
+
 # Copyright Josiah Plett 2024
 
 
@@ -39,22 +42,22 @@ def load_data(csv_file):
     return X, y
 
 
-def evaluate_ridge_classifier(X, y, lambdas, K=10):
+def evaluate_ridge_classifier(X, y, lambdas, K=10, workers=None):
     """
     Evaluate Ridge Classification with different regularization parameters using K-fold cross-validation.
     Returns the mean cross-validation error for each lambda.
     """
-    cv_errors = []
-    kf = KFold(n_splits=K, shuffle=True)
+    # Set random state to an arbitrary number so we can reproduce results
+    kf = KFold(n_splits=K, shuffle=True, random_state=42)
 
-    for lam in lambdas:
-        model = RidgeClassifier(alpha=lam)
+    # Each fold is factorized once for all the lambdas (see ridge_path.py), one fold per worker process
+    with CVExecutor(X, y, workers) as executor:
         # 1 - accuracy is equal to error rate
-        error_scores = 1 - cross_val_score(model, X, y, cv=kf, scoring="accuracy")
-        mean_error = np.mean(error_scores)
-        cv_errors.append(mean_error)
+        error_scores = 1 - executor.cross_val_path_scores(
+            ridge_classifier_path, RidgeClassifier(), "alpha", lambdas, kf.split(X)
+        )
 
-    return cv_errors
+    return list(error_scores.mean(axis=1))
 
 
 def plot_errors(lambdas, cv_errors):
@@ -1,11 +1,16 @@
+import argparse
+
 import numpy as np
 import pandas as pd
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.linear_model import RidgeClassifier
 from sklearn.dummy import DummyClassifier
-from sklearn.model_selection import KFold, cross_val_score
 import matplotlib.pyplot as plt
 
+from nested_cv import ModelFamily, print_outer_folds, run_nested_cv
+from ridge_path import ridge_classifier_path
+from tree_path import APPROXIMATION_NOTE, tree_depth_path
+
 # Copyright Josiah Plett 2024
 
 
@@ -41,79 +46,34 @@ def load_data(csv_file):
     return X, y
 
 
-def nested_cv(X, y, lambdas, tree_complexities, K1, K2):
-    out_tc_optimal = []
-    out_error_rate_tree = []  # E_test
-    out_lam_optimal = []
-    out_error_rate_regression = []  # E_test
-    out_error_rate_baseline = []  # E_test
-
-    fold_ctr = 0
-    outer_cv = KFold(n_splits=K1, shuffle=True)
-    for par_idx, test_idx in outer_cv.split(X):
-        X_par = X[par_idx, :]
-        y_par = y[par_idx]
-        X_test = X[test_idx, :]
-        y_test = y[test_idx]
-
-        inner_cv = KFold(n_splits=K2, shuffle=True)
-
-        # inner cv on tree model
-        tc_optimal = 0
-        min_tree_error = np.inf
-        for tc in tree_complexities:
-            tree_model = DecisionTreeClassifier(criterion="gini", max_depth=tc)
-            error = 1 - cross_val_score(tree_model, X_par, y_par, cv=inner_cv, scoring="accuracy")
-            mean_error = np.mean(error)
-            if mean_error < min_tree_error:
-                min_tree_error = mean_error
-                tc_optimal = tc
-
-        # inner cv on regression model
-        lam_optimal = 0
-        min_regression_error = np.inf
-        for lam in lambdas:
-            regression_model = RidgeClassifier(alpha=lam)
-            error = 1 - cross_val_score(regression_model, X_par, y_par, cv=inner_cv, scoring="accuracy")
-            mean_error = np.mean(error)
-            if mean_error < min_regression_error:
-                min_regression_error = mean_error
-                lam_optimal = lam
-        
-        # test models against test set
-        tree_model = DecisionTreeClassifier(criterion="gini", max_depth=tc_optimal)
-        regression_model = RidgeClassifier(alpha=lam_optimal)
-        baseline_model = DummyClassifier(strategy="most_frequent")
-
-        tree_model.fit(X_par, y_par)
-        regression_model.fit(X_par, y_par)
-        baseline_model.fit(X_par, y_par)
-
-        n_tree_misclassifications = np.not_equal(tree_model.predict(X_test), y_test).sum()
-        n_regression_misclassifications = np.not_equal(regression_model.predict(X_test), y_test).sum()
-        n_baseline_misclassifications = np.not_equal(baseline_model.predict(X_test), y_test).sum()
-
-        error_rate_tree = n_tree_misclassifications / y_test.shape[0]
-        error_rate_regression = n_regression_misclassifications / y_test.shape[0]
-        error_rate_baseline = n_baseline_misclassifications / y_test.shape[0]
-
-        out_tc_optimal.append(tc_optimal)
-        out_error_rate_tree.append(error_rate_tree)
-        out_lam_optimal.append(lam_optimal)
-        out_error_rate_regression.append(error_rate_regression)
-        out_error_rate_baseline.append(error_rate_baseline)
-
-        fold_ctr += 1
-
-        print(f"Outer Fold {fold_ctr}")
-        print( "---------------------")
-        print(f"(DecisionTreeClassifier) Optimal Max Depth: {tc_optimal}")
-        print(f"(DecisionTreeClassifier) Test Error: {error_rate_tree}")
-        print(f"(RidgeClassifier) Optimal Regularization Parameter: {lam_optimal}")
-        print(f"(RidgeClassifier) Test Error: {error_rate_regression}")
-        print(f"(DummyClassifier) Test Error: {error_rate_baseline}")
+def get_model_families(lambdas, tree_complexities, fast_trees=False):
+    return [
+        ModelFamily(
+            "DecisionTreeClassifier", DecisionTreeClassifier(criterion="gini"), "max_depth", tree_complexities, "Max Depth",
+            # A tree per depth; with fast_trees, one tree at the deepest max_depth per inner fold scores every depth
+            path=tree_depth_path if fast_trees else None,
+        ),
+        ModelFamily(
+            "RidgeClassifier", RidgeClassifier(), "alpha", lambdas, "Regularization Parameter",
+            path=ridge_classifier_path,  # One factorization per inner fold scores every lambda
+        ),
+        ModelFamily("DummyClassifier", DummyClassifier(strategy="most_frequent")),
+    ]
+
+
+def nested_cv(X, y, lambdas, tree_complexities, K1, K2, workers=None, fast_trees=False):
+    # The outer folds run concurrently on a process pool, see nested_cv.py
+    families = get_model_families(lambdas, tree_complexities, fast_trees)
+    results = run_nested_cv(X, y, families, K1, K2, workers=workers)
+    print_outer_folds(families, results)
+    if fast_trees:
+        print(APPROXIMATION_NOTE)
         print()
-    return out_tc_optimal, out_error_rate_tree, out_lam_optimal, out_error_rate_regression, out_error_rate_baseline
+    return (
+        results["DecisionTreeClassifier"]["optimal"], results["DecisionTreeClassifier"]["test_error"],
+        results["RidgeClassifier"]["optimal"], results["RidgeClassifier"]["test_error"],
+        results["DummyClassifier"]["test_error"]
+    )
 
 
 def plot_errors(tc_optimal, error_tree, lam_optimal, error_regression, error_baseline):
@@ -146,14 +106,25 @@ def plot_errors(tc_optimal, error_tree, lam_optimal, error_regression, error_bas
     plt.show()
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Nested cross-validation of the tree, ridge and baseline classifiers.")
+    parser.add_argument("--fast-trees", action="store_true",
+                        help="choose max_depth by cutting one deep tree down to every depth instead of fitting a tree "
+                             "at each (faster, but only approximate, see tree_path.py)")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     input_csv = "../../data/output/project_2_classification_standardized.csv"
 
     X, y = load_data(input_csv)
     lambdas = np.logspace(-8, 0, 50)
     tree_complexities = np.arange(2, 21, 1)
 
-    tc_optimal, error_tree, lam_optimal, error_regression, error_baseline = nested_cv(X, y, lambdas, tree_complexities, 10, 10)
+    tc_optimal, error_tree, lam_optimal, error_regression, error_baseline = nested_cv(
+        X, y, lambdas, tree_complexities, 10, 10, fast_trees=args.fast_trees
+    )
 
     print("Tree Complexity*:", tc_optimal)
     print("Test Error (Tree):", error_tree)
@@ -1,51 +1,283 @@
+"""
+FINAL MODEL
+
+Fits the RidgeClassifier chosen in classification_4 on every game and saves it
+as a JSON artifact: its coefficients, the features they go with, and the
+min/max normalization classification_1 fitted. The artifact is everything
+needed to predict new games, so scoring a new month needs no retraining.
+
+    python classification_5.py train
+    python classification_5.py score ../../data/output/months/2024-09.csv
+
+score reads the parsed games (from pgn_parser.py or filter_endgames.py) in
+chunks, prepares them exactly like classification_1, and writes every game's
+predicted Result (1 = White win, 0 = Draw, -1 = Black win) next to its GameId.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
 import pandas as pd
 from sklearn.linear_model import RidgeClassifier
 
+from classification_1 import (
+    INPUT_COLUMNS, NEGATIVE_TIME_REGEX, RESULT_VALUES, TERMINATIONS, clean_games, load_column_stats,
+    load_columnar_games, process_games
+)
+
 # Copyright Josiah Plett 2024
 
+# Bumped whenever the artifact's layout changes, so an old artifact is never misread
+ARTIFACT_FORMAT_VERSION = 1
+
+# The model predicts these columns' index; these are the Result values they stand for
+RESULT_COLUMNS = ["ResultBlackWin", "ResultDraw", "ResultWhiteWin"]
+RESULTS = [-1, 0, 1]
+
+# The model's inputs, in the order of its coefficients
+FEATURES = [
+    "BetterPlayer",
+    "EloDifference",
+    "TotalPlies",
+    "OpeningPlies",
+    "MiddlegamePlies",
+    "EndgamePlies",
+    "WhiteOpeningTime",
+    "BlackOpeningTime",
+    "WhiteMiddlegameTime",
+    "BlackMiddlegameTime",
+    "WhiteEndgameTime",
+    "BlackEndgameTime",
+    "TerminationNormal",
+    "TerminationTimeForfeit"
+]
+
+CHUNK_SIZE = 100_000
+
 
 def load_data(csv_file):
     data = pd.read_csv(csv_file)
 
-    data = data[
-        [
-            "BetterPlayer",
-            "ResultBlackWin",
-            "ResultDraw",
-            "ResultWhiteWin",
-            "EloDifference",
-            "TotalPlies",
-            "OpeningPlies",
-            "MiddlegamePlies",
-            "EndgamePlies",
-            "WhiteOpeningTime",
-            "BlackOpeningTime",
-            "WhiteMiddlegameTime",
-            "BlackMiddlegameTime",
-            "WhiteEndgameTime",
-            "BlackEndgameTime",
-            "TerminationNormal",
-            "TerminationTimeForfeit"
-        ]
-    ]
+    data = data[FEATURES + RESULT_COLUMNS]
 
     # Separate features and target variable
-    X = data.drop(["ResultBlackWin", "ResultDraw", "ResultWhiteWin"], axis=1).to_numpy()
-    y = data[["ResultBlackWin", "ResultDraw", "ResultWhiteWin"]].to_numpy().argmax(axis=1)
+    X = data[FEATURES].to_numpy()
+    y = data[RESULT_COLUMNS].to_numpy().argmax(axis=1)
 
     return X, y
 
 
-def main():
-    input_csv = "../../data/output/project_2_classification_standardized.csv"
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
 
+
+def train(input_csv, stats_json, artifact_path, lam):
+    """
+    Fit the model on the standardized games and save it, with everything score needs, to artifact_path.
+    """
     X, y = load_data(input_csv)
-    lam = 2.8117686979742253e-06
 
     model = RidgeClassifier(alpha=lam)
     model.fit(X, y)
 
-    model  # <-- here it is, the trained model
+    artifact = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model": "RidgeClassifier",
+        "alpha": lam,
+        "features": FEATURES,
+        "results": [RESULTS[label] for label in model.classes_],
+        "coef": model.coef_.tolist(),
+        "intercept": model.intercept_.tolist(),
+        "normalization": load_column_stats(stats_json),
+        "training_data": {"path": os.path.basename(input_csv), "rows": len(y), "sha256": hash_file(input_csv)},
+    }
+    # Identifies this exact model, so predictions can be traced back to it
+    artifact["model_version"] = hashlib.sha256(json.dumps(artifact, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    temporary_path = artifact_path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as outfile:
+        json.dump(artifact, outfile, indent=2)
+    os.replace(temporary_path, artifact_path)
+
+    print(f"Trained on {len(y)} games, training error rate {np.mean(model.predict(X) != y):.4f}.")
+    print(f"Saved model {artifact['model_version']} to {artifact_path}.")
+
+
+def load_artifact(artifact_path):
+    with open(artifact_path, "r", encoding="utf-8") as infile:
+        artifact = json.load(infile)
+    if artifact.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        sys.exit(f"{artifact_path} is in artifact format {artifact.get('format_version')}, "
+                 f"this script reads format {ARTIFACT_FORMAT_VERSION}. Train the model again.")
+    return artifact
+
+
+def read_game_chunks(games_csv):
+    # The columns classification_1 needs, the ones prepare_parsed_games needs,
+    # and GameId when the file has it (older parses don't). A pgn_parser.py --format npy
+    # directory is loaded in one piece, its columns are small enough.
+    if os.path.isdir(games_csv):
+        return [load_columnar_games(games_csv, extra_columns=["GameId"])]
+    columns = pd.read_csv(games_csv, nrows=0).columns
+    wanted = INPUT_COLUMNS + ["TotalMoves", "WhiteTotalTime", "BlackTotalTime", "GameId"]
+    usecols = [column for column in wanted if column in columns]
+    return pd.read_csv(games_csv, usecols=usecols, dtype=str, keep_default_na=False, chunksize=CHUNK_SIZE)
+
+
+def prepare_parsed_games(games):
+    # pgn_parser's output, before filter_endgames: the ply count is TotalMoves, and the middlegame
+    # time of a game without an endgame still has to be worked out
+    if "TotalMoves" not in games:
+        return games
+    games = games.rename(columns={"TotalMoves": "TotalPlies"})
+    no_endgame = games["Endgame"] == "-1"
+    for player in ["White", "Black"]:
+        middlegame_time = (games[f"{player}TotalTime"].astype(float) - games[f"{player}OpeningTime"].astype(float)).round(4)
+        games[f"{player}MiddlegameTime"] = games[f"{player}MiddlegameTime"].mask(no_endgame, middlegame_time.astype(str))
+    return games
+
+
+def predict(artifact, games, skipped=None):
+    """
+    Predicted Results of parsed games, as a Series on the games' index. Games classification_1 drops
+    (a negative move time) and games it can't encode (a missing Elo, or a Result or Termination like
+    "Abandoned" that it doesn't know) are left out, and counted by reason in the skipped Counter if one is given.
+    """
+    # A missing Elo is '' in a CSV and NaN from a columnar directory
+    rated = pd.to_numeric(games["EloDifference"], errors="coerce").notna()
+    cleaned = clean_games(prepare_parsed_games(games[rated]))
+    known = cleaned["Result"].isin(RESULT_VALUES) & cleaned["Termination"].isin(TERMINATIONS)
+    if skipped is not None:
+        skipped["a missing Elo"] += int((~rated).sum())
+        skipped["a negative move time"] += int(rated.sum()) - len(cleaned)
+        skipped["an unknown Result or Termination"] += int((~known).sum())
+    cleaned = cleaned[known]
+    X = process_games(cleaned, artifact["normalization"])[artifact["features"]].to_numpy(dtype=np.float64)
+    return pd.Series(predict_features(artifact, X), index=cleaned.index)
+
+
+def record_features(artifact, record):
+    """
+    The features of one game, a row of pgn_parser.py's output as a dict, in artifact["features"] order.
+    These are the values predict() computes through classification_1, worked out without pandas so a
+    single game skips its per-call overhead. Raises ValueError for a game classification_1 would drop or can't read.
+    """
+    if re.search(NEGATIVE_TIME_REGEX, str(record["WhiteTimes"])) or re.search(NEGATIVE_TIME_REGEX, str(record["BlackTimes"])):
+        raise ValueError("the game has a negative move time")
+
+    elo_difference = float(record["EloDifference"])
+    total_plies = int(record["TotalMoves"])
+    middlegame = int(record["Middlegame"])
+    endgame = int(record["Endgame"])
+    no_endgame = str(record["Endgame"]) == "-1"
+
+    cleaned = {
+        "BetterPlayer": int(elo_difference >= 0),
+        "EloDifference": abs(elo_difference),
+        "TotalPlies": total_plies,
+        "OpeningPlies": middlegame / total_plies,
+        "MiddlegamePlies": ((total_plies - middlegame) if no_endgame else (endgame - middlegame)) / total_plies,
+        "EndgamePlies": 0 if no_endgame else (total_plies - endgame) / total_plies,
+        # Only the unfinished game of a partial PGN is neither
+        "TerminationNormal": int(record["Termination"] == "Normal"),
+        "TerminationTimeForfeit": int(record["Termination"] == "Time forfeit"),
+    }
+    for player in ["White", "Black"]:
+        opening_time = float(record[f"{player}OpeningTime"])
+        cleaned[f"{player}OpeningTime"] = opening_time
+        if no_endgame:
+            # As prepare_parsed_games works it out
+            cleaned[f"{player}MiddlegameTime"] = float(np.round(float(record[f"{player}TotalTime"]) - opening_time, 4))
+            cleaned[f"{player}EndgameTime"] = 0.0
+        else:
+            cleaned[f"{player}MiddlegameTime"] = float(record[f"{player}MiddlegameTime"])
+            cleaned[f"{player}EndgameTime"] = float(record[f"{player}EndgameTime"])
+
+    minimum = artifact["normalization"]["min"]
+    maximum = artifact["normalization"]["max"]
+    return [
+        (cleaned[feature] - minimum[feature]) / (maximum[feature] - minimum[feature]) if feature in minimum
+        else cleaned[feature]
+        for feature in artifact["features"]
+    ]
+
+
+def predict_features(artifact, X):
+    # Predicted Results of rows that already hold the model's features, in artifact["features"] order
+    scores = X @ np.array(artifact["coef"]).T + np.array(artifact["intercept"])
+    return np.array(artifact["results"])[scores.argmax(axis=1)]
+
+
+def score(games_csv, artifact_path, output_csv):
+    """
+    Predict every game in games_csv a chunk at a time, writing GameId,PredictedResult to output_csv.
+    Games without a GameId column are identified by their row number in the file.
+    """
+    artifact = load_artifact(artifact_path)
+    start = time.monotonic()
+    scored = 0
+    skipped = collections.Counter()
+
+    header = True
+    for games in read_game_chunks(games_csv):
+        predictions = predict(artifact, games, skipped)
+        game_ids = games["GameId"] if "GameId" in games else games.index.to_series().astype(str)
+        output = pd.DataFrame({"GameId": game_ids[predictions.index], "PredictedResult": predictions})
+        output.to_csv(output_csv, mode="w" if header else "a", header=header, index=False)
+        header = False
+
+        scored += len(predictions)
+        print(f"Scored {scored} games...")
+
+    print(f"Scored {scored} games with model {artifact['model_version']} in {time.monotonic() - start:.1f}s, "
+          f"written to {output_csv}.")
+    # Skipped games are left out of the output
+    for reason, count in skipped.items():
+        if count:
+            print(f"Skipped {count} games with {reason}.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the final RidgeClassifier, or predict games with it.")
+    parser.add_argument("--artifact", default="../../data/output/project_2_ridge_classifier.json",
+                        help="the saved model (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command")
+
+    train_parser = commands.add_parser("train", help="fit the model on every game and save it (the default)")
+    train_parser.add_argument("--input", default="../../data/output/project_2_classification_standardized.csv")
+    train_parser.add_argument("--stats", default="../../data/output/project_2_classification_scaler.json",
+                              help="the min/max saved by classification_1.py")
+    train_parser.add_argument("--alpha", type=float, default=2.8117686979742253e-06)
+
+    score_parser = commands.add_parser("score", help="predict the result of every game in a parsed games CSV")
+    score_parser.add_argument("games_csv", help="a parsed games CSV, or a pgn_parser.py --format npy directory")
+    score_parser.add_argument("-o", "--output", help="default: the games CSV with .predictions.csv at the end")
+
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(sys.argv[1:] + ["train"])
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.command == "train":
+        train(args.input, args.stats, args.artifact, args.alpha)
+    elif args.command == "score":
+        output_csv = args.output or os.path.splitext(args.games_csv.rstrip("/\\"))[0] + ".predictions.csv"
+        score(args.games_csv, args.artifact, output_csv)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""
+CV EXECUTOR
+
+Cross-validation as independent (hyperparameter, fold) tasks spread over a pool
+of worker processes.
+
+The data is written once to .npy files in a temporary directory, and every
+worker memory-maps them, so the operating system shares one copy between all
+the processes and a task only carries its estimator and where its fold's rows
+are. Each task's random_state is fixed by the executor's seed and the task's
+fold, so the scores are exactly the same for any number of workers, including
+workers=1, which runs the tasks in this process.
+
+    kf = KFold(n_splits=10, shuffle=True, random_state=42)
+    with CVExecutor(X, y) as executor:
+        scores = executor.cross_val_scores(RidgeClassifier(), "alpha", lambdas, kf.split(X), "accuracy")
+    errors = 1 - scores.mean(axis=1)
+"""
+
+import os
+import tempfile
+from multiprocessing import Pool
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+
+# Copyright Josiah Plett 2024
+
+# The memory-mapped arrays a process has opened, by path
+loaded_arrays = {}
+
+
+def load_array(directory, name):
+    path = os.path.join(directory, f"{name}.npy")
+    if path not in loaded_arrays:
+        loaded_arrays[path] = np.load(path, mmap_mode="r")
+    return loaded_arrays[path]
+
+
+def run_task(task):
+    # Fit on one fold's training rows, then, by the kind of task:
+    # "score" scores the estimator on the fold's test rows,
+    # "predict" returns its predictions for them,
+    # "path" has a path function fit for every value at once and returns each value's accuracy
+    kind, directory, splits_name, (train_start, test_start, test_stop), estimator, arguments = task
+    X = load_array(directory, "X")
+    y = load_array(directory, "y")
+    rows = load_array(directory, splits_name)
+
+    train_rows = rows[train_start:test_start]
+    test_rows = rows[test_start:test_stop]
+    X_train, y_train = np.asarray(X[train_rows]), np.asarray(y[train_rows])
+    X_test, y_test = np.asarray(X[test_rows]), np.asarray(y[test_rows])
+
+    if kind == "path":
+        path, param_name, values = arguments
+        return np.mean(path(estimator, param_name, values, X_train, y_train, X_test) == y_test, axis=1)
+
+    estimator.fit(X_train, y_train)
+    if kind == "predict":
+        return estimator.predict(X_test)
+    return get_scorer(arguments)(estimator, X_test, y_test)
+
+
+class CVExecutor:
+    def __init__(self, X, y, workers=None, random_state=0):
+        self.X = np.asarray(X)
+        self.y = np.asarray(y)
+        self.workers = workers or os.cpu_count()
+        self.random_state = random_state
+        self.directory = None
+        self.pool = None
+        self.splits_written = 0
+
+    def __enter__(self):
+        self.directory = tempfile.TemporaryDirectory(prefix="cv_executor_")
+        np.save(os.path.join(self.directory.name, "X.npy"), self.X)
+        np.save(os.path.join(self.directory.name, "y.npy"), self.y)
+        if self.workers > 1:
+            self.pool = Pool(self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        # Drop this process's maps of the files before they're deleted
+        for path in [path for path in loaded_arrays if path.startswith(self.directory.name)]:
+            del loaded_arrays[path]
+        self.directory.cleanup()
+
+    def get_seed(self, *keys):
+        # A task's seed depends only on which fold it is, so every hyperparameter value is compared fairly
+        return int(np.random.SeedSequence([self.random_state, *keys]).generate_state(1)[0])
+
+    def seeded(self, estimator, *keys):
+        if "random_state" in estimator.get_params() and estimator.random_state is None:
+            estimator.set_params(random_state=self.get_seed(*keys))
+        return estimator
+
+    def write_splits(self, splits):
+        # Every fold's training rows then test rows, one after another, in a single shared file
+        rows = []
+        bounds = []
+        start = 0
+        for train_rows, test_rows in splits:
+            rows.extend([train_rows, test_rows])
+            bounds.append((start, start + len(train_rows), start + len(train_rows) + len(test_rows)))
+            start = bounds[-1][2]
+
+        splits_name = f"splits_{self.splits_written}"
+        self.splits_written += 1
+        np.save(os.path.join(self.directory.name, f"{splits_name}.npy"), np.concatenate(rows).astype(np.int64))
+        return splits_name, bounds
+
+    def score_tasks(self, estimator, param_name, values, splits, scoring, seed_keys=()):
+        # The tasks of cross_val_scores, in (value, fold) order, to run together with other tasks
+        splits_name, bounds = self.write_splits(splits)
+        return [
+            (
+                "score", self.directory.name, splits_name, fold_bounds,
+                self.seeded(clone(estimator).set_params(**{param_name: value}), *seed_keys, fold), scoring,
+            )
+            for value in values
+            for fold, fold_bounds in enumerate(bounds)
+        ]
+
+    def path_tasks(self, path, estimator, param_name, values, splits, seed_keys=()):
+        """
+        The tasks of cross_val_scores for a path function, which fits once per fold for all the values
+        and returns every value's predictions. Each task's result is the accuracy of every value.
+        """
+        splits_name, bounds = self.write_splits(splits)
+        values = list(values)
+        return [
+            (
+                "path", self.directory.name, splits_name, fold_bounds,
+                self.seeded(clone(estimator), *seed_keys, fold), (path, param_name, values),
+            )
+            for fold, fold_bounds in enumerate(bounds)
+        ]
+
+    def predict_tasks(self, estimators, splits, seed_keys=()):
+        # Fit estimators[i] on the training rows of splits[i] and predict its test rows
+        splits_name, bounds = self.write_splits(splits)
+        return [
+            ("predict", self.directory.name, splits_name, fold_bounds, self.seeded(clone(estimator), *seed_keys, fold), None)
+            for fold, (estimator, fold_bounds) in enumerate(zip(estimators, bounds))
+        ]
+
+    def run(self, tasks):
+        # The results of the tasks, in order
+        if self.pool is None:
+            return [run_task(task) for task in tasks]
+        return self.pool.map(run_task, tasks)
+
+    def cross_val_scores(self, estimator, param_name, values, splits, scoring):
+        """
+        Score the estimator with param_name set to every value, on every (train rows, test rows) split
+        of X and y, like cross_val_score does for one value. Returns an array of shape (values, folds).
+        """
+        values = list(values)
+        splits = list(splits)
+        scores = self.run(self.score_tasks(estimator, param_name, values, splits, scoring))
+        return np.array(scores).reshape(len(values), len(splits))
+
+    def cross_val_path_scores(self, path, estimator, param_name, values, splits):
+        """
+        The accuracy of every value on every split like cross_val_scores, from a path function that
+        fits each split once for all the values. Returns an array of shape (values, folds).
+        """
+        scores = self.run(self.path_tasks(path, estimator, param_name, values, list(splits)))
+        return np.array(scores).T
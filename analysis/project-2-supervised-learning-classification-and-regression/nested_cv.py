@@ -0,0 +1,115 @@
+"""
+NESTED CV
+
+Two-level cross-validation of several model families at once. In every outer
+fold, each family's hyperparameter is chosen by K2-fold cross-validation on the
+outer training rows, and the family is then refitted with that value and tested
+on the outer test rows.
+
+Nothing here waits on a single outer fold: the inner sweeps of all the outer
+folds go to the CVExecutor pool as one batch, and so do the final fits, so the
+workers stay busy across outer folds. All the folds and seeds are fixed by
+random_state.
+
+    families = [
+        ModelFamily("DecisionTreeClassifier", DecisionTreeClassifier(), "max_depth", range(2, 21), "Max Depth"),
+        ModelFamily("DummyClassifier", DummyClassifier(strategy="most_frequent")),
+    ]
+    results = run_nested_cv(X, y, families, K1=10, K2=10)
+    results["DecisionTreeClassifier"]["optimal"]  # the chosen max_depth of each outer fold
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import KFold
+
+from cv_executor import CVExecutor
+
+# Copyright Josiah Plett 2024
+
+# A family without a param_name is fitted as it is, with nothing to tune. A family with a path
+# function (see tree_path.py) scores all its values from one fit per fold instead of a fit per value.
+ModelFamily = namedtuple(
+    "ModelFamily", ["name", "estimator", "param_name", "values", "param_label", "path"], defaults=[None, None, None, None]
+)
+
+
+def run_nested_cv(X, y, families, K1=10, K2=10, random_state=42, workers=None):
+    """
+    Returns, for every family by name, the hyperparameter value chosen in each outer fold ("optimal"),
+    the test error of each outer fold ("test_error") and every row's out-of-fold prediction ("y_pred").
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    tuned = [family for family in families if family.param_name is not None]
+
+    outer_cv = KFold(n_splits=K1, shuffle=True, random_state=random_state)
+    outer_splits = list(outer_cv.split(X))
+
+    with CVExecutor(X, y, workers, random_state) as executor:
+        # Every inner sweep of every outer fold, as one batch of tasks
+        tasks = []
+        for outer, (par_idx, _) in enumerate(outer_splits):
+            inner_cv = KFold(n_splits=K2, shuffle=True, random_state=random_state)
+            # The inner folds as rows of X, so the workers can use their shared copy
+            inner_splits = [(par_idx[train_idx], par_idx[val_idx]) for train_idx, val_idx in inner_cv.split(par_idx)]
+            for family in tuned:
+                if family.path is not None:
+                    # One task per inner fold, scoring every value
+                    tasks.extend(executor.path_tasks(
+                        family.path, family.estimator, family.param_name, family.values, inner_splits, seed_keys=(outer,)
+                    ))
+                else:
+                    # One task per (value, inner fold)
+                    tasks.extend(executor.score_tasks(
+                        family.estimator, family.param_name, family.values, inner_splits, "accuracy", seed_keys=(outer,)
+                    ))
+        scores = iter(executor.run(tasks))
+
+        optimal = {family.name: [] for family in families}
+        for outer in range(K1):
+            for family in tuned:
+                values = list(family.values)
+                if family.path is not None:
+                    inner_scores = np.array([next(scores) for _ in range(K2)]).T
+                else:
+                    inner_scores = np.array([next(scores) for _ in range(len(values) * K2)]).reshape(len(values), K2)
+                inner_errors = 1 - inner_scores
+                optimal[family.name].append(values[np.argmin(inner_errors.mean(axis=1))])
+
+        # Every family refitted with its optimal value on every outer fold, again as one batch
+        estimators = []
+        for outer in range(K1):
+            for family in families:
+                estimator = clone(family.estimator)
+                if family.param_name is not None:
+                    estimator.set_params(**{family.param_name: optimal[family.name][outer]})
+                estimators.append(estimator)
+        family_splits = [split for split in outer_splits for _ in families]
+        predictions = iter(executor.run(executor.predict_tasks(estimators, family_splits)))
+
+    results = {
+        family.name: {"optimal": optimal[family.name], "test_error": [], "y_pred": np.empty_like(y)}
+        for family in families
+    }
+    for _, test_idx in outer_splits:
+        for family in families:
+            y_pred = next(predictions)
+            results[family.name]["test_error"].append(np.not_equal(y_pred, y[test_idx]).mean())
+            results[family.name]["y_pred"][test_idx] = y_pred
+    return results
+
+
+def print_outer_folds(families, results):
+    # The per-fold report classification_3 and classification_4 print
+    for outer in range(len(results[families[0].name]["test_error"])):
+        print(f"Outer Fold {outer + 1}")
+        print( "---------------------")
+        for family in families:
+            result = results[family.name]
+            if family.param_name is not None:
+                print(f"({family.name}) Optimal {family.param_label or family.param_name}: {result['optimal'][outer]}")
+            print(f"({family.name}) Test Error: {result['test_error'][outer]}")
+        print()
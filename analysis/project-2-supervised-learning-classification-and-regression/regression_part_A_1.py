@@ -34,57 +34,151 @@ except Termination — to set their mean to 0 and standard deviation to 1.
 STANDARDIZATION
 """
 
-import csv
-
-# Copyright Josiah Plett 2024
+import argparse
+import collections
+import json
 
+import numpy as np
+import pandas as pd
 
-def standardize_data(data, columns_to_standardize):
-    means = {}
-    stds = {}
-
-    print("Collecting column values for standardization...")
+# Copyright Josiah Plett 2024
 
-    column_data = {col: [] for col in columns_to_standardize}
-    for row in data:
-        for col in columns_to_standardize:
-            try:
-                value = float(row[col])
-            except ValueError:
-                value = 0.0  # Handle missing or invalid data
-            column_data[col].append(value)
+CHUNK_SIZE = 100_000
+
+# Read as missing in the standardized columns (pandas' defaults); the other columns keep every string
+NA_VALUES = ["", "NA", "N/A", "NaN", "nan", "null", "None"]
+
+INPUT_CSV = "../../data/output/project_2_part_a_1_pre.csv"
+OUTPUT_CSV = "../../data/output/project_2_part_a_standardized.csv"
+SCALER_JSON = "../../data/output/project_2_part_a_scaler.json"
+
+
+def read_chunks(input_csv, columns, typed=True):
+    """
+    The CSV a chunk at a time. The columns to standardize are parsed straight to float64 (or, with
+    typed=False, read as strings like the rest, for a file with text in them), and every other column
+    is kept as the original strings, so it is copied as it is.
+    """
+    if not typed:
+        return pd.read_csv(input_csv, dtype=str, keep_default_na=False, chunksize=CHUNK_SIZE, encoding="utf-8")
+    return pd.read_csv(
+        input_csv, dtype=collections.defaultdict(lambda: str, {column: np.float64 for column in columns}),
+        keep_default_na=False, na_values={column: NA_VALUES for column in columns},
+        chunksize=CHUNK_SIZE, encoding="utf-8",
+    )
+
+
+def to_values(chunk, columns):
+    # Missing or invalid data counts as 0.0, and the mask says where that happened
+    values = chunk[columns]
+    if not all(dtype == np.float64 for dtype in values.dtypes):
+        values = values.apply(pd.to_numeric, errors="coerce")
+    values = values.to_numpy(dtype=np.float64)
+    invalid = np.isnan(values)
+    values[invalid] = 0.0
+    return values, invalid
+
+
+def with_typed_columns(function, *args):
+    # Run a pass over the CSV with its columns read as floats, or again from the start with them read
+    # as strings if one of them has text pandas can't parse (it counts as invalid there)
+    try:
+        return function(*args, typed=True)
+    except ValueError:
+        return function(*args, typed=False)
+
+
+def fit_standardization(input_csv, columns_to_standardize, typed=True):
+    """
+    Compute each column's mean and standard deviation in one streaming pass, merging the
+    per-chunk statistics with Chan et al.'s parallel update so memory stays flat.
+    """
+    count = 0
+    mean = np.zeros(len(columns_to_standardize))
+    m2 = np.zeros(len(columns_to_standardize))  # Sum of squared differences from the mean
 
     print("Computing means and standard deviations...")
 
-    for col in columns_to_standardize:
-        values = column_data[col]
-        mean = sum(values) / len(values)
-        std = (sum((x - mean) ** 2 for x in values) / len(values)) ** 0.5
-        means[col] = mean
-        stds[col] = std if std != 0 else 1  # Prevent division by zero
+    for chunk in read_chunks(input_csv, columns_to_standardize, typed):
+        values, _ = to_values(chunk, columns_to_standardize)
+        chunk_count = values.shape[0]
+        if chunk_count == 0:
+            continue
+        chunk_mean = values.mean(axis=0)
+        chunk_m2 = ((values - chunk_mean) ** 2).sum(axis=0)
+
+        delta = chunk_mean - mean
+        total = count + chunk_count
+        mean = mean + delta * chunk_count / total
+        m2 = m2 + chunk_m2 + delta**2 * count * chunk_count / total
+        count = total
+
+    std = np.sqrt(m2 / count) if count else np.ones_like(m2)
+    std[std == 0] = 1  # Prevent division by zero
+
+    return {
+        "rows": count,
+        "mean": dict(zip(columns_to_standardize, mean.tolist())),
+        "std": dict(zip(columns_to_standardize, std.tolist())),
+    }
+
+
+def standardize_csv(input_csv, output_csv, scaler, typed=True):
+    """
+    Stream the CSV again and write it with the scaler's columns standardized, a chunk at a time.
+    """
+    columns = list(scaler["mean"])
+    mean = np.array([scaler["mean"][col] for col in columns])
+    std = np.array([scaler["std"][col] for col in columns])
 
     print("Standardizing the data...")
 
     rows = 0
-    for row in data:
-        for col in columns_to_standardize:
-            try:
-                value = float(row[col])
-                standardized_value = (value - means[col]) / stds[col]
-                row[col] = standardized_value
-            except ValueError:
-                print(f"Invalid data in column {col}: {row[col]}")
-                row[col] = 0.0  # Handle missing or invalid data
-        rows += 1
-        if rows % 2000 == 0:
-            print(f"Standardized {rows} rows...")
-
-    return data
+    invalid_counts = np.zeros(len(columns), dtype=np.int64)
+    header = True
+    for chunk in read_chunks(input_csv, columns, typed):
+        values, invalid = to_values(chunk, columns)
+        standardized = (values - mean) / std
+        standardized[invalid] = 0.0  # Handle missing or invalid data
+        invalid_counts += invalid.sum(axis=0)
+
+        chunk[columns] = standardized
+        chunk.to_csv(output_csv, mode="w" if header else "a", header=header, index=False, lineterminator="\r\n")
+        header = False
+
+        rows += len(chunk)
+        print(f"Standardized {rows} rows...")
+
+    for col, invalid_count in zip(columns, invalid_counts):
+        if invalid_count:
+            print(f"Invalid data in column {col}: {invalid_count} rows")
+
+
+def save_scaler(scaler, scaler_json):
+    with open(scaler_json, "w", encoding="utf-8") as outfile:
+        json.dump(scaler, outfile, indent=2)
+
+
+def load_scaler(scaler_json):
+    with open(scaler_json, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Standardize the part A attributes, fitting the mean and std or reusing saved ones."
+    )
+    parser.add_argument(
+        "input_csv", nargs="?",
+        help=f"attributes to standardize with the saved scaler; without it, {INPUT_CSV} is fitted and saved",
+    )
+    parser.add_argument("output_csv", nargs="?", default=OUTPUT_CSV, help="standardized CSV (default: %(default)s)")
+    parser.add_argument("scaler_json", nargs="?", default=SCALER_JSON, help="mean and std (default: %(default)s)")
+    return parser.parse_args()
 
 
 def main():
-    input_csv = "../../data/output/project_2_part_a_1_pre.csv"
-    output_csv = "../../data/output/project_2_standardized.csv"
+    args = parse_args()
 
     columns_to_standardize = [
         "TotalPlies",
@@ -96,20 +190,17 @@ def main():
         "BlackTotalTime",
     ]
 
-    # Read data from CSV
-    with open(input_csv, "r", encoding="utf-8") as infile:
-        reader = csv.DictReader(infile)
-        data = list(reader)
-        fieldnames = reader.fieldnames
-
-    # Standardize data
-    standardized_data = standardize_data(data, columns_to_standardize)
-
-    # Write standardized data to new CSV
-    with open(output_csv, "w", newline="", encoding="utf-8") as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(standardized_data)
+    # To standardize new data with the mean and std saved earlier, pass the paths:
+    # python regression_part_A_1.py new_input.csv new_output.csv project_2_part_a_scaler.json
+    if args.input_csv is not None:
+        input_csv = args.input_csv
+        scaler = load_scaler(args.scaler_json)
+    else:
+        input_csv = INPUT_CSV
+        scaler = with_typed_columns(fit_standardization, input_csv, columns_to_standardize)
+        save_scaler(scaler, args.scaler_json)
+
+    with_typed_columns(standardize_csv, input_csv, args.output_csv, scaler)
 
 
 if __name__ == "__main__":
@@ -35,10 +35,10 @@ tion can barely help.
 
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import Ridge
-from sklearn.model_selection import KFold, cross_val_score
 import matplotlib.pyplot as plt
 
+from ridge_path import ridge_cv_errors
+
 # Copyright Josiah Plett 2024
 
 
@@ -69,20 +69,9 @@ def evaluate_ridge_regression(X, y, lambdas, K=10):
     Evaluate Ridge Regression with different regularization parameters using K-fold cross-validation.
     Returns the mean cross-validation error for each lambda.
     """
-    cv_errors = []
     # Set random state to an arbitrary number so we can reproduce results + decrease variance.
-    kf = KFold(n_splits=K, shuffle=True, random_state=42)
-
-    for lam in lambdas:
-        model = Ridge(alpha=lam)
-        # Use negative mean squared error as scoring because cross_val_score maximizes the score
-        mse_scores = cross_val_score(
-            model, X, y, cv=kf, scoring="neg_mean_squared_error"
-        )
-        mean_mse = -np.mean(mse_scores)
-        cv_errors.append(mean_mse)
-
-    return cv_errors
+    # Each training fold is factorized once and scored for every lambda, see ridge_path.py.
+    return list(ridge_cv_errors(X, y, lambdas, K=K, random_state=42))
 
 
 def plot_errors(lambdas, cv_errors):
@@ -14,14 +14,21 @@ ANSWER:
 TBD
 """
 
+import json
+import os
+
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import Ridge
-from sklearn.model_selection import KFold, cross_val_score
 import matplotlib.pyplot as plt
 
+from ridge_path import ridge_cv_errors
+
 # Copyright Josiah Plett 2024
 
+# Bumped whenever the artifact's layout changes, so an old artifact is never misread
+ARTIFACT_FORMAT_VERSION = 1
+
 
 def load_data(csv_file):
     data = pd.read_csv(csv_file)
@@ -56,20 +63,9 @@ def evaluate_ridge_regression(X, y, lambdas, K=10):
     Evaluate Ridge Regression with different regularization parameters using K-fold cross-validation.
     Returns the mean cross-validation error for each lambda.
     """
-    cv_errors = []
     # Set random state to an arbitrary number so we can reproduce results + decrease variance.
-    kf = KFold(n_splits=K, shuffle=True, random_state=42)
-
-    for lam in lambdas:
-        model = Ridge(alpha=lam)
-        # Use negative mean squared error as scoring because cross_val_score maximizes the score
-        mse_scores = cross_val_score(
-            model, X, y, cv=kf, scoring="neg_mean_squared_error"
-        )
-        mean_mse = -np.mean(mse_scores)
-        cv_errors.append(mean_mse)
-
-    return cv_errors
+    # Each training fold is factorized once and scored for every lambda, see ridge_path.py.
+    return list(ridge_cv_errors(X, y, lambdas, K=K, random_state=42))
 
 
 def plot_errors(lambdas, cv_errors_full, cv_errors_reduced):
@@ -120,6 +116,36 @@ def print_model_coefficients(X, y, optimal_lambda):
         print(f"{feature}: {coef}")
 
 
+def save_game_length_model(X, y, optimal_lambda, scaler_json, artifact_path):
+    """
+    Fit ridge regression with the optimal lambda and save it with the standardization it expects, so raw
+    game features can be turned into a predicted number of plies without the training data.
+    """
+    model = Ridge(alpha=optimal_lambda)
+    model.fit(X, y)
+
+    with open(scaler_json, "r", encoding="utf-8") as infile:
+        scaler = json.load(infile)
+
+    artifact = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model": "Ridge",
+        "alpha": float(optimal_lambda),
+        "target": y.name,
+        "features": list(X.columns),
+        "coef": model.coef_.tolist(),
+        "intercept": float(model.intercept_),
+        # The model works on standardized values: (value - mean) / std
+        "standardization": scaler,
+    }
+
+    temporary_path = artifact_path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as outfile:
+        json.dump(artifact, outfile, indent=2)
+    os.replace(temporary_path, artifact_path)
+    print(f"\nSaved the full model with lambda {optimal_lambda} to {artifact_path}")
+
+
 def main():
     input_csv = "../../data/output/project_2_part_a_standardized.csv"
 
@@ -153,6 +179,13 @@ def main():
     print("\nReduced Model Coefficients:")
     print_model_coefficients(X_reduced, y, optimal_lambda_reduced)
 
+    # Save the best full model for predicting game lengths
+    save_game_length_model(
+        X_full, y, optimal_lambda_full,
+        "../../data/output/project_2_part_a_scaler.json",
+        "../../data/output/project_2_game_length_model.json",
+    )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+"""
+RIDGE PATH
+
+K-fold cross-validation of ridge regression (and RidgeClassifier) for a whole
+range of lambdas at once.
+
+Each training fold is centered (the same way sklearn's Ridge fits its intercept) and its
+Gram matrix X^T X is eigendecomposed once. With X^T X = V diag(w) V^T, the ridge solution
+for any lambda is V diag(1 / (w + lambda)) V^T X^T y, so every lambda costs one small
+p x p product instead of a new fit, and the test fold is scored for all lambdas together.
+"""
+
+import numpy as np
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import LabelBinarizer
+
+# Copyright Josiah Plett 2024
+
+
+def fit_ridge_path(X, y, lambdas):
+    """
+    Fit ridge regression with an intercept for every lambda, to one target y or to the columns of a
+    2D y. Returns the coefficients and intercepts with the lambdas as their last axis.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lambdas = np.asarray(lambdas, dtype=np.float64)
+    Y = y.reshape(len(y), -1)
+
+    X_mean = X.mean(axis=0)
+    Y_mean = Y.mean(axis=0)
+    X_centered = X - X_mean
+
+    eigenvalues, eigenvectors = np.linalg.eigh(X_centered.T @ X_centered)
+    projected = eigenvectors.T @ (X_centered.T @ (Y - Y_mean))
+
+    # Directions the data doesn't span get no weight, like the least squares solution at lambda = 0
+    shrunk = eigenvalues[:, None] + lambdas[None, :]
+    tolerance = eigenvalues.max(initial=0) * len(eigenvalues) * np.finfo(np.float64).eps
+    scale = np.divide(1.0, shrunk, out=np.zeros_like(shrunk), where=shrunk > tolerance)
+
+    # coefs[:, target, lambda] = V diag(scale[:, lambda]) V^T X^T Y[:, target]
+    coefs = np.einsum("ij,jk,jl->ikl", eigenvectors, projected, scale)
+    intercepts = Y_mean[:, None] - np.einsum("i,ikl->kl", X_mean, coefs)
+    if y.ndim == 1:
+        return coefs[:, 0], intercepts[0]
+    return coefs, intercepts
+
+
+def ridge_path_mse(X_train, y_train, X_test, y_test, lambdas):
+    # The test mean squared error of the ridge model fitted on the training data, for every lambda
+    coefs, intercepts = fit_ridge_path(X_train, y_train, lambdas)
+    predictions = np.asarray(X_test, dtype=np.float64) @ coefs + intercepts
+    residuals = predictions - np.asarray(y_test, dtype=np.float64)[:, None]
+    return np.mean(residuals**2, axis=0)
+
+
+def ridge_cv_errors(X, y, lambdas, K=10, random_state=42):
+    """
+    The mean K-fold cross-validation error of ridge regression for every lambda, using the same
+    folds as KFold(n_splits=K, shuffle=True, random_state=random_state).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    kf = KFold(n_splits=K, shuffle=True, random_state=random_state)
+
+    fold_errors = [
+        ridge_path_mse(X[train_index], y[train_index], X[test_index], y[test_index], lambdas)
+        for train_index, test_index in kf.split(X)
+    ]
+    return np.mean(fold_errors, axis=0)
+
+
+def ridge_classifier_path(estimator, param_name, lambdas, X_train, y_train, X_test):
+    """
+    A ModelFamily path for RidgeClassifier's alpha (with its default fit_intercept and no class weights).
+    Like RidgeClassifier, regresses one +1/-1 column per class and predicts the class with the highest
+    score, but solves every class and every lambda from one factorization of the training fold.
+    Returns the predictions for X_test, one row per lambda.
+    """
+    binarizer = LabelBinarizer(pos_label=1, neg_label=-1)
+    Y = binarizer.fit_transform(y_train)
+    coefs, intercepts = fit_ridge_path(X_train, Y, lambdas)
+
+    # scores[lambda, row, class]
+    scores = np.einsum("ij,jkl->lik", np.asarray(X_test, dtype=np.float64), coefs) + intercepts.T[:, None, :]
+    if scores.shape[2] == 1:
+        # Two classes are regressed as one column, positive for the second class
+        return binarizer.classes_[(scores[:, :, 0] > 0).astype(int)]
+    return binarizer.classes_[scores.argmax(axis=2)]
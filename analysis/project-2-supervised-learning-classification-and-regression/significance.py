@@ -0,0 +1,108 @@
+"""
+SIGNIFICANCE
+
+Statistical comparison of any number of classifiers from their out-of-fold
+predictions on the same rows.
+
+mcnemar_matrix runs McNemar's test, with the beta-distribution interval for the
+accuracy difference, on every pair of models at once: with the models'
+correctness as a matrix, one matrix product counts the rows each model gets
+right and the other gets wrong, for all the pairs together.
+
+bootstrap_error_ci resamples the rows with replacement thousands of times and
+takes percentile intervals of each model's error rate. Rows are resampled once
+for all the models, so the replicates keep the pairing between them. A model's
+error on a resample only depends on which models got each row right, so the
+rows are grouped by that pattern and each replicate is a multinomial draw of
+how many rows of each pattern it holds, never an index array the size of the data.
+
+    predictions = np.array([y_pred_tree, y_pred_regression, y_pred_baseline])
+    mcnemar = mcnemar_matrix(predictions, y_true)
+    errors = bootstrap_error_ci(predictions, y_true)
+    print_significance(["Tree", "Regression", "Baseline"], mcnemar, errors)
+"""
+
+import numpy as np
+from scipy.stats import beta, binom
+
+# Copyright Josiah Plett 2024
+
+# Most pattern counts drawn at once (replicates x patterns)
+REPLICATE_BLOCK_SIZE = 4_000_000
+
+
+def mcnemar_matrix(predictions, y_true, significance=0.05):
+    """
+    McNemar's test of every pair of models, from predictions of shape (models, rows). Returns square
+    matrices indexed [a, b]: the estimated accuracy difference A - B ("theta"), its confidence interval
+    ("ci_low", "ci_high"), the p-value ("p"), and the rows only A got right ("n12"). On the diagonal, where a
+    model meets itself, theta and n12 are 0 and the interval and p-value are NaN.
+    """
+    correct = (np.asarray(predictions) == np.asarray(y_true)).astype(np.float64)
+    n = correct.shape[1]
+
+    # n12[a, b]: rows A got right and B got wrong
+    n12 = correct @ (1 - correct).T
+    n21 = n12.T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theta = (n12 - n21) / n
+        Q = (n**2 * (n + 1) * (theta + 1) * (1 - theta)) / (n * (n12 + n21) - (n12 - n21) ** 2)
+        f = (Q - 1) * (theta + 1) / 2
+        g = (Q - 1) * (1 - theta) / 2
+
+        ci_low = 2 * beta.ppf(significance / 2, f, g) - 1
+        ci_high = 2 * beta.ppf(1 - significance / 2, f, g) - 1
+    p = 2 * binom.cdf(np.minimum(n12, n21), n12 + n21, 0.5)
+
+    diagonal = np.eye(len(correct), dtype=bool)
+    for matrix in [ci_low, ci_high, p]:
+        matrix[diagonal] = np.nan
+
+    return {"theta": theta, "ci_low": ci_low, "ci_high": ci_high, "p": p, "n12": n12.astype(np.int64)}
+
+
+def bootstrap_error_ci(predictions, y_true, replicates=10_000, significance=0.05, random_state=42):
+    """
+    Every model's error rate ("error") with a percentile bootstrap confidence interval ("ci_low",
+    "ci_high") from the given number of replicates, and the replicates' error rates themselves
+    ("replicates", of shape (replicates, models)).
+    """
+    errors = np.asarray(predictions) != np.asarray(y_true)
+    n = errors.shape[1]
+
+    # Which models got each row wrong, and how many rows share each such pattern
+    patterns, counts = np.unique(errors.T, axis=0, return_counts=True)
+
+    # How many rows of each pattern every replicate draws, then each model's error rate on it,
+    # a block of replicates at a time so the draws stay small however many patterns there are
+    rng = np.random.default_rng(random_state)
+    replicate_errors = np.empty((replicates, len(errors)))
+    block = max(1, REPLICATE_BLOCK_SIZE // len(patterns))
+    for start in range(0, replicates, block):
+        drawn = rng.multinomial(n, counts / n, size=min(block, replicates - start))
+        replicate_errors[start:start + len(drawn)] = drawn @ patterns.astype(np.float64) / n
+
+    ci_low, ci_high = np.quantile(replicate_errors, [significance / 2, 1 - significance / 2], axis=0)
+    return {"error": errors.mean(axis=1), "ci_low": ci_low, "ci_high": ci_high, "replicates": replicate_errors}
+
+
+def print_significance(names, mcnemar, errors, significance=0.05):
+    # Each model's error rate with its interval, then McNemar's test of every pair
+    print(f"Error rates (bootstrap CI, alpha = {significance})")
+    print("--------------------------------------------")
+    for i, name in enumerate(names):
+        print(f"{name}: {errors['error'][i]:.4f} [{errors['ci_low'][i]:.4f}, {errors['ci_high'][i]:.4f}]")
+    print()
+
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            title = f"McNemar's Test: {names[a]} vs. {names[b]}"
+            print(title)
+            print("-" * len(title))
+            if mcnemar["n12"][a, b] + mcnemar["n12"][b, a] < 5:
+                print("WARNING: n12 + n21 < 5; confidence interval estimation is probably not accurate")
+            print(f"Estimated accuracy difference (A - B): {mcnemar['theta'][a, b]}")
+            print(f"Accuracy difference CI (alpha = {significance}): [{mcnemar['ci_low'][a, b]}, {mcnemar['ci_high'][a, b]}]")
+            print(f"p-value: {mcnemar['p'][a, b]}")
+            print()
@@ -0,0 +1,67 @@
+"""
+TREE PATH
+
+Scores a decision tree at every max_depth from one tree per fold.
+
+A greedy tree grown to the deepest max_depth holds, up to ties, every
+shallower tree as its top levels, and sklearn stores the class distribution of
+every node, leaf or not. So the prediction of the tree cut off at depth d is the majority class of
+the node a row reaches after at most d splits, and one walk down the deep tree
+gives the predictions at every depth together.
+
+This is an approximation. sklearn breaks exact ties between two splits by its
+random feature order, which depends on how many nodes it has split before, and
+the deep tree splits more of them. Ties are common in this data, so about 5% of
+the cut trees' predictions differ from a DecisionTreeClassifier(max_depth=d)
+fitted on its own (on the lichess sample; about as often as two separate fits
+with different random_state differ), which is enough to change the chosen
+max_depth. So classification_3 and classification_4 fit every depth for real
+by default, and only use this with --fast-trees, saying so in their output.
+Either way, the outer folds' test errors are of trees fitted at the chosen
+depth.
+"""
+
+import numpy as np
+from sklearn.base import clone
+
+# Copyright Josiah Plett 2024
+
+# Printed with results that tree_depth_path scored (--fast-trees)
+APPROXIMATION_NOTE = (
+    "Note: the optimal Max Depth was chosen by cutting one deep tree per inner fold down to each depth, which "
+    "only approximates fitting every depth (see tree_path.py); the test errors are of trees fitted at the chosen "
+    "depth. Run without --fast-trees to fit every depth."
+)
+
+
+def predict_depths(tree, X, depths):
+    """
+    Predictions of the fitted tree cut off at each of the depths, one row per depth.
+    """
+    tree_ = tree.tree_
+    # The tree compares float32 features against its thresholds
+    X = np.asarray(X, dtype=np.float32)
+    rows = np.arange(len(X))
+    node = np.zeros(len(X), dtype=np.intp)
+
+    predictions = {}
+    for depth in range(max(depths) + 1):
+        if depth in depths:
+            predictions[depth] = tree.classes_.take(tree_.value[node, 0].argmax(axis=1))
+
+        left = tree_.children_left[node]
+        internal = left != -1
+        # Leaves have no feature (-2); rows at a leaf stay there whatever they're compared with
+        feature = np.where(internal, tree_.feature[node], 0)
+        goes_left = X[rows, feature] <= tree_.threshold[node]
+        node = np.where(internal, np.where(goes_left, left, tree_.children_right[node]), node)
+
+    return np.array([predictions[depth] for depth in depths])
+
+
+def tree_depth_path(estimator, param_name, depths, X_train, y_train, X_test):
+    # A ModelFamily path for max_depth: fit once at the deepest depth, predict at all of them
+    depths = [int(depth) for depth in depths]
+    tree = clone(estimator).set_params(**{param_name: max(depths)})
+    tree.fit(X_train, y_train)
+    return predict_depths(tree, X_test, depths)
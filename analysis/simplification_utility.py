@@ -10,25 +10,27 @@ import csv
 import os
 import re
 import glob
+import sys
 
 # Copyright Josiah Plett 2024
 
-def simplify_csv(input_csv, columns_to_keep):
-    # 1. Establish what the output CSV filename should be
-    input_dir = os.path.dirname(input_csv)
-    if input_dir == '':
-        input_dir = '.'
-    pattern = os.path.join(input_dir, 'project_2_simplified_*.csv')
-    existing_files = glob.glob(pattern)
-    existing_indices = []
-    for filename in existing_files:
-        match = re.search(r'project_2_simplified_(\d+)\.csv', os.path.basename(filename))
-        if match:
-            existing_indices.append(int(match.group(1)))
-    new_index = max(existing_indices) + 1 if existing_indices else 1
-
-    # Set output filename
-    output_csv = os.path.join(input_dir, f'project_2_simplified_{new_index}.csv')
+def simplify_csv(input_csv, columns_to_keep, output_csv=None):
+    # 1. Establish what the output CSV filename should be, unless we were given one
+    if output_csv is None:
+        input_dir = os.path.dirname(input_csv)
+        if input_dir == '':
+            input_dir = '.'
+        pattern = os.path.join(input_dir, 'project_2_simplified_*.csv')
+        existing_files = glob.glob(pattern)
+        existing_indices = []
+        for filename in existing_files:
+            match = re.search(r'project_2_simplified_(\d+)\.csv', os.path.basename(filename))
+            if match:
+                existing_indices.append(int(match.group(1)))
+        new_index = max(existing_indices) + 1 if existing_indices else 1
+
+        # Set output filename
+        output_csv = os.path.join(input_dir, f'project_2_simplified_{new_index}.csv')
 
     # Filter out all columns except the ones we want to keep
     with open(input_csv, 'r', encoding='utf-8') as infile, \
@@ -61,11 +63,18 @@ def main():
     input_csv = '../data/output/project_2_all_games.csv'
     # input_csv = '../data/output/project_2_endgame_games.csv'
 
+    # Or pass the input (and output) CSV as arguments, e.g. from pipeline.py
+    output_csv = None
+    if len(sys.argv) > 1:
+        input_csv = sys.argv[1]
+    if len(sys.argv) > 2:
+        output_csv = sys.argv[2]
+
     # Define the attributes you want to keep!
     # Preferably, put the attribute you're predicting at the start.
     columns_to_keep = ['TotalPlies', 'EloDifference', 'Middlegame', 'WhiteOpeningTime', 'BlackOpeningTime', 'WhiteTotalTime', 'BlackTotalTime', 'Termination']
 
-    simplify_csv(input_csv, columns_to_keep)
+    simplify_csv(input_csv, columns_to_keep, output_csv)
 
 if __name__ == '__main__':
     main()
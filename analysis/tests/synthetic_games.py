@@ -0,0 +1,51 @@
+"""
+SYNTHETIC GAMES
+
+Random legal Chess960 games with clock times, the same ones for a given seed. The
+tests parse them, and benchmark.py times the parser on them.
+"""
+
+import chess
+import chess.pgn
+import numpy as np
+
+# Copyright Josiah Plett 2024
+
+SYNTHETIC_GAMES = 300
+SEED = 2024
+
+
+def format_clock(seconds):
+    return f'{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+def make_synthetic_pgn(game_count=SYNTHETIC_GAMES, seed=SEED):
+    # Random legal 3|0 Chess960 games with a %clk comment after every move, the same for a given seed
+    rng = np.random.default_rng(seed)
+    games = []
+    for game_number in range(game_count):
+        board = chess.Board.from_chess960_pos(int(rng.integers(960)))
+        game = chess.pgn.Game()
+        game.setup(board)
+        white_elo, black_elo = (int(elo) for elo in rng.integers(1200, 2400, size=2))
+        game.headers.update({
+            'Event': 'Rated Chess960 game', 'Site': f'https://lichess.org/synth{game_number:04}',
+            'White': f'white{game_number}', 'Black': f'black{game_number}',
+            'Result': ['1-0', '0-1', '1/2-1/2'][int(rng.integers(3))],
+            'WhiteElo': str(white_elo), 'BlackElo': str(black_elo), 'TimeControl': '180+0',
+            'Termination': ['Normal', 'Time forfeit'][int(rng.random() < 0.2)],
+        })
+
+        clocks = [180, 180]
+        node = game
+        for _ in range(int(rng.integers(20, 160))):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = moves[int(rng.integers(len(moves)))]
+            player = 0 if board.turn == chess.WHITE else 1
+            clocks[player] = max(0, clocks[player] - int(rng.integers(0, 5)))
+            board.push(move)
+            node = node.add_variation(move, comment=f'[%clk {format_clock(clocks[player])}]')
+        games.append(str(game))
+    return '\n\n'.join(games) + '\n'
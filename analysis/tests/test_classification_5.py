@@ -0,0 +1,95 @@
+import ast
+import collections
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ANALYSIS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ANALYSIS_DIR)
+sys.path.insert(0, os.path.join(ANALYSIS_DIR, 'project-2-supervised-learning-classification-and-regression'))
+import classification_5  # noqa: E402
+from columnar_games import ColumnarWriter  # noqa: E402
+from classification_1 import COLUMNS_TO_NORMALIZE, clean_games, get_column_stats  # noqa: E402
+
+# Copyright Josiah Plett 2024
+
+
+def make_row(game_id, termination='Normal', result='1', elo_difference='25'):
+    # One game as pgn_parser.py writes it, with an endgame
+    return {
+        'GameId': game_id, 'Result': result, 'EloDifference': elo_difference, 'Termination': termination,
+        'WhiteTimes': '[1, 2, 3, 4, 5]', 'BlackTimes': '[2, 2, 2, 2, 2]', 'TotalMoves': '10', 'Middlegame': '4',
+        'Endgame': '8', 'WhiteOpeningTime': '0.05', 'BlackOpeningTime': '0.04', 'WhiteMiddlegameTime': '0.2',
+        'BlackMiddlegameTime': '0.25', 'WhiteEndgameTime': '0.1', 'BlackEndgameTime': '0.05',
+        'WhiteTotalTime': '0.35', 'BlackTotalTime': '0.34',
+    }
+
+
+def make_artifact(rows):
+    games = classification_5.prepare_parsed_games(pd.DataFrame(rows))
+    rng = np.random.default_rng(0)
+    return {
+        'model_version': 'test',
+        'features': classification_5.FEATURES,
+        'results': classification_5.RESULTS,
+        'coef': rng.standard_normal((3, len(classification_5.FEATURES))).tolist(),
+        'intercept': [0.0, 0.0, 0.0],
+        'normalization': get_column_stats(clean_games(games), COLUMNS_TO_NORMALIZE),
+    }
+
+
+def test_score_skips_abandoned_game(tmp_path, capsys):
+    rows = [make_row('a'), make_row('b', termination='Abandoned', result='-1'), make_row('c', elo_difference='-40')]
+    artifact = dict(make_artifact([rows[0], rows[2]]), format_version=classification_5.ARTIFACT_FORMAT_VERSION)
+    artifact_path = tmp_path / 'model.json'
+    artifact_path.write_text(json.dumps(artifact), encoding='utf-8')
+
+    games_csv = tmp_path / 'games.csv'
+    pd.DataFrame(rows).to_csv(games_csv, index=False)
+    output_csv = tmp_path / 'games.predictions.csv'
+    classification_5.score(str(games_csv), str(artifact_path), str(output_csv))
+
+    with open(output_csv, newline='', encoding='utf-8') as infile:
+        scored = list(csv.DictReader(infile))
+    assert [row['GameId'] for row in scored] == ['a', 'c']
+    assert 'Skipped 1 games with an unknown Result or Termination.' in capsys.readouterr().out
+
+
+def test_predict_counts_skipped_games():
+    rows = [make_row('a'), make_row('b', termination='Abandoned'), make_row('c', result='2')]
+    rows.append(dict(make_row('d'), WhiteTimes='[1, -2, 3, 4, 5]'))
+    skipped = classification_5.collections.Counter()
+    predictions = classification_5.predict(make_artifact(rows[:1]), pd.DataFrame(rows), skipped)
+
+    assert list(predictions.index) == [0]
+    assert skipped == collections.Counter({'a negative move time': 1, 'an unknown Result or Termination': 2})
+
+
+def test_predict_skips_missing_elo(tmp_path):
+    rows = [make_row('a'), make_row('b', elo_difference='')]
+    artifact = make_artifact(rows[:1])
+
+    # The CSV path: EloDifference is '' in the parsed CSV
+    games_csv = tmp_path / 'games.csv'
+    pd.DataFrame(rows).to_csv(games_csv, index=False)
+    from_csv = pd.concat(classification_5.read_game_chunks(str(games_csv)))
+
+    # The npy path: the same games as pgn_parser.py --format npy writes them
+    columns_dir = tmp_path / 'games'
+    with ColumnarWriter(str(columns_dir)) as writer:
+        for row in rows:
+            writer.writerow(dict(
+                row, White='w', Black='b', WhiteElo='1500', BlackElo='', TimeControl='180+0', FEN='',
+                WhiteTimes=ast.literal_eval(row['WhiteTimes']), BlackTimes=ast.literal_eval(row['BlackTimes']),
+            ))
+    from_columns = classification_5.read_game_chunks(str(columns_dir))[0]
+
+    for games in [from_csv, from_columns]:
+        skipped = collections.Counter()
+        predictions = classification_5.predict(artifact, games, skipped)
+        assert list(games['GameId'][predictions.index]) == ['a']
+        assert skipped == collections.Counter({'a missing Elo': 1})
@@ -0,0 +1,67 @@
+import csv
+import io
+import os
+import sys
+
+import chess.pgn
+import numpy as np
+import pandas as pd
+
+ANALYSIS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ANALYSIS_DIR)
+sys.path.insert(0, os.path.join(ANALYSIS_DIR, 'project-2-supervised-learning-classification-and-regression'))
+import classification_1  # noqa: E402
+import filter_endgames  # noqa: E402
+from columnar_games import ColumnarWriter, any_per_game, load_games  # noqa: E402
+from pgn_parser import FIELDNAMES, read_record  # noqa: E402
+from synthetic_games import make_synthetic_pgn  # noqa: E402
+
+# Copyright Josiah Plett 2024
+
+
+def parse_games(game_count):
+    # Rows of pgn_parser.py's output for some synthetic games, one of them with a negative move time
+    pgn = io.StringIO(make_synthetic_pgn(game_count))
+    records = []
+    while (record := read_record(pgn)) is not None:
+        if record is not chess.pgn.SKIP:
+            records.append(record)
+    records[1]['WhiteTimes'][2] = -3
+    return records
+
+
+def test_any_per_game():
+    values = np.array([1, -1, 2, 3, 0, -2])
+    offsets = np.array([0, 2, 4, 6])
+    assert any_per_game(values < 0, offsets).tolist() == [True, False, True]
+
+
+def test_columnar_games_give_the_csv_features(tmp_path):
+    records = parse_games(40)
+
+    # The CSV route: pgn_parser.py's CSV, then filter_endgames.py
+    parsed_csv = tmp_path / 'parsed.csv'
+    with open(parsed_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(records)
+    all_games_csv = tmp_path / 'all_games.csv'
+    filter_endgames.process_games(str(parsed_csv), str(all_games_csv), str(tmp_path / 'endgame_games.csv'))
+
+    # The columnar route: pgn_parser.py --format npy
+    columns_dir = tmp_path / 'parsed'
+    with ColumnarWriter(str(columns_dir)) as writer:
+        for record in records:
+            writer.writerow(record)
+
+    from_csv = classification_1.clean_games(classification_1.load_games(str(all_games_csv)))
+    from_columns = classification_1.clean_games(classification_1.load_games(str(columns_dir)))
+    assert len(from_csv) == len(records) - 1
+
+    column_stats = classification_1.get_column_stats(from_csv, classification_1.COLUMNS_TO_NORMALIZE)
+    assert classification_1.get_column_stats(from_columns, classification_1.COLUMNS_TO_NORMALIZE) == column_stats
+    pd.testing.assert_frame_equal(
+        classification_1.process_games(from_columns, column_stats),
+        classification_1.process_games(from_csv, column_stats),
+        check_exact=True,
+    )
@@ -0,0 +1,44 @@
+import io
+import os
+import sys
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pgn_parser import HeaderFilter, parse_shard, read_record  # noqa: E402
+
+# Copyright Josiah Plett 2024
+
+MOVES = ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5', 'c3', 'Nf6', 'd4', 'exd4']
+
+
+def make_pgn(time_control, clocks):
+    # One game of ten plies with the given TimeControl and each ply's %clk in seconds
+    game = chess.pgn.Game()
+    game.headers.update({'Site': 'https://lichess.org/test', 'TimeControl': time_control, 'Result': '1-0',
+                         'WhiteElo': '1500', 'BlackElo': '1400', 'Termination': 'Normal'})
+    node = game
+    for move, clock in zip(MOVES, clocks):
+        node = node.add_variation(node.board().parse_san(move), comment=f'[%clk 0:{clock // 60:02}:{clock % 60:02}]')
+    return str(game) + '\n\n'
+
+
+def test_kept_time_control_is_parsed_with_its_own_clock():
+    # 180+2: the first move of each player isn't timed, every later one gets the 2 seconds back
+    clocks = [180, 180, 179, 177, 178, 176, 180, 175, 181, 174]
+    record = read_record(io.StringIO(make_pgn('180+2', clocks)), HeaderFilter(['180+2']))
+
+    assert record['TimeControl'] == '180+2'
+    assert record['WhiteTimes'] == [0, 3, 3, 0, 1]
+    assert record['BlackTimes'] == [0, 5, 3, 3, 3]
+    assert record['WhiteTotalTime'] == round(sum(record['WhiteTimes']) / 180, 4)
+
+
+def test_every_header_drop_is_counted():
+    clocks = [180, 180, 179, 177, 178, 176, 180, 175, 181, 174]
+    shard = (make_pgn('180+0', clocks) + make_pgn('180+2', clocks) + make_pgn('-', clocks)).encode('utf-8')
+
+    rows, rejected = parse_shard(shard, HeaderFilter(['180+2', '-']))
+    assert [row['TimeControl'] for row in rows] == ['180+2']
+    # 180+0 isn't kept, and '-' is kept but has no clock to follow
+    assert rejected['TimeControl'] == 2
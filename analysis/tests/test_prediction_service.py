@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service import RequestError, parse_request  # noqa: E402
+
+# Copyright Josiah Plett 2024
+
+
+@pytest.mark.parametrize('body', ['{"pgn": 12}', '{"pgn": null}', '{"pgn": ["1. e4"]}'])
+def test_pgn_must_be_a_string(body):
+    with pytest.raises(RequestError) as error:
+        parse_request(body, 14)
+    assert error.value.status == 400
+    assert str(error.value) == 'pgn must be a string'